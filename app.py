@@ -1,15 +1,14 @@
 from __future__ import annotations
 
-from itsdangerous import URLSafeSerializer
+from itsdangerous import URLSafeSerializer, BadSignature
 
 from datetime import datetime, timezone, timedelta
+from email.utils import format_datetime, parsedate_to_datetime
 from pathlib import Path
-import mimetypes
+import bisect
+import json
 import os
 import anyio
-import subprocess
-import tempfile
-import shutil
 
 from urllib.parse import quote
 from contextlib import asynccontextmanager
@@ -19,6 +18,7 @@ from cryptography.fernet import Fernet
 from fastapi import FastAPI, Request, Depends, UploadFile, File
 
 from fastapi.responses import (
+    Response,
     HTMLResponse,
     RedirectResponse,
     PlainTextResponse,
@@ -38,6 +38,12 @@ import config
 
 
 from controllers import ctl_wasabi
+from dal import dal_entry
+from dal import dal_wasabi
+from dal import dal_jobs
+from controllers import ctl_convert
+from controllers import ctl_thumb
+from controllers import ctl_jobs
 
 
 # ------------------------------------------------------------------------------
@@ -53,7 +59,51 @@ TEMPLATE_DIR = os.getenv("TEMPLATE_DIR", "templates")
 # 12h session lifetime (Flask used permanent_session_lifetime = 12h).
 SESSION_MAX_AGE = int(os.getenv("SESSION_MAX_AGE", str(int(timedelta(hours=12).total_seconds()))))
 
-maxFileNameLength = 64
+# Browser caching of /browse and /download: private to the user's browser and revalidated
+# (ETag / Last-Modified -> 304) after max-age seconds. 0 = revalidate on every use.
+OBJECT_CACHE_MAX_AGE = int(os.getenv("OBJECT_CACHE_MAX_AGE", "0"))
+# Per tenant/folder max-age, comma separated "[login:]path/prefix=seconds"; the longest matching
+# prefix wins, rules with a login only apply to that tenant. Folders clients can overwrite
+# through IAM (Área_do_Cliente) are best left at the default.
+OBJECT_CACHE_POLICY = os.getenv(
+    "OBJECT_CACHE_POLICY", "Materiais_do_Cliente/Fotos/=3600,Materiais_do_Cliente/Vídeos/=3600"
+)
+
+
+def parse_cache_policy(spec: str) -> list[tuple[str, str, int]]:
+    # -> [(login or "", prefix, max_age)], longest prefix first
+    rules = []
+    for item in spec.split(","):
+        rule, sep, seconds = item.strip().rpartition("=")
+        if not sep or not rule:
+            continue
+        login, sep, prefix = rule.rpartition(":")
+        rules.append((login, prefix.lstrip("/"), int(seconds)))
+    return sorted(rules, key=lambda r: (len(r[1]), bool(r[0])), reverse=True)
+
+
+OBJECT_CACHE_RULES = parse_cache_policy(OBJECT_CACHE_POLICY)
+
+# Presigned delivery: /browse and /download answer with a redirect to a short-lived presigned
+# GET URL (after the session check), so the bytes go straight from Wasabi to the browser.
+# On for every object (PRESIGNED_DELIVERY=1), or only for objects >= PRESIGNED_MIN_SIZE bytes
+# and/or with one of PRESIGNED_EXTENSIONS (comma separated, e.g. "mp4,mov,zip").
+PRESIGNED_DELIVERY = os.getenv("PRESIGNED_DELIVERY", "0") == "1"
+PRESIGNED_MIN_SIZE = int(os.getenv("PRESIGNED_MIN_SIZE", "-1"))
+PRESIGNED_EXTENSIONS = {e.strip().lower().lstrip(".") for e in os.getenv("PRESIGNED_EXTENSIONS", "").split(",") if e.strip()}
+PRESIGNED_EXPIRES = int(os.getenv("PRESIGNED_EXPIRES", "300"))
+
+# Folder listing: the page renders the first LIST_PAGE_SIZE rows, the rest comes from
+# /api/list/ (cursor-paginated) as the user scrolls.
+LIST_PAGE_SIZE = int(os.getenv("LIST_PAGE_SIZE", "200"))
+
+# Chunked/resumable upload: each chunk is one S3 multipart part (min 5MB except the last).
+UPLOAD_CHUNK_SIZE = max(int(os.getenv("UPLOAD_CHUNK_SIZE", str(8 * 1024 * 1024))), 5 * 1024 * 1024)
+# Direct uploads: the browser PUTs each part to a presigned URL, straight to Wasabi (the bucket
+# CORS must allow PUT from this origin); the app only authorizes, signs and completes.
+DIRECT_UPLOAD = os.getenv("DIRECT_UPLOAD", "0") == "1"
+PRESIGNED_UPLOAD_EXPIRES = int(os.getenv("PRESIGNED_UPLOAD_EXPIRES", "3600"))
+PRESIGNED_UPLOAD_BATCH = 100
 
 BLOCKED_EXTENSIONS = {
     ".exe", ".bat", ".cmd", ".com", ".msi",
@@ -86,7 +136,9 @@ class MaxBodySizeMiddleware(BaseHTTPMiddleware):
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     #await carrega_globais(app)
+    ctl_wasabi.start_catalog_sync()
     yield
+    ctl_wasabi.S3_EXECUTOR.shutdown(wait=False)
     #await connect_db.disconnect()
 
 
@@ -111,23 +163,10 @@ app.mount("/static", StaticFiles(directory="static"), name="static")
 # File type icons (same as Flask app)
 # ------------------------------------------------------------------------------
 
-tp_dict = {
-    "image": [["png", "jpg", "svg", "jpeg", "png", "gif", "bmp", "raw"], "fa fa-file-image"],
-    "audio": [["mp3", "wav", "ogg", "mpeg", "aac", "3gpp", "3gpp2", "aiff", "x-aiff", "amr", "mpga", "m4a","flac"], "fa fa-file-audio"],
-    "video": [["mp4", "webm", "opgg", "flv", "mov", "mkv"], "fa fa-file-video"],
-    "pdf": [["pdf"], "fa fa-file-pdf"],
-    "ppt": [["ppt", "pptx", "odp"], "fa fa-file-powerpoint"],
-    "doc": [["docx", "doc", "odt"], "fa fa-file-word"],
-    "excel": [["xls", "xlsx", "ods"], "fa fa-file-excel"],
-    "text": [["txt", "rtf", "csv", "log", "xml", "md"], "fa fa-file-alt"],
-    "compressed": [["zip", "rar", "7z"], "fa a-file-alt"],
-    "code": [["css", "scss", "html", "py", "js", "cpp"], "fa fa-file-code"],
-}
 
 
 def get_mime_type(file_extension: str) -> str | None:
-    mime_type, _ = mimetypes.guess_type(f"file.{file_extension}")
-    return mime_type
+    return dal_entry.ext_info(file_extension)[2]
 
 
 def nocache_headers() -> dict[str, str]:
@@ -141,6 +180,111 @@ def nocache_headers() -> dict[str, str]:
     }
 
 
+def http_date(dt: datetime) -> str:
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return format_datetime(dt.astimezone(timezone.utc), usegmt=True)
+
+
+def parse_range(range_header: str | None, size: int) -> tuple[int, int] | None:
+    # single "bytes=start-end" range -> (start, end) inclusive; None = serve the whole object.
+    # Raises ValueError when the range cannot be satisfied (416).
+    if not range_header or not range_header.startswith("bytes="):
+        return None
+    spec = range_header[len("bytes="):].strip()
+    if "," in spec or "-" not in spec:
+        return None  # multi-range: ignored, 200 with the full body is allowed
+    first, last = (p.strip() for p in spec.split("-", 1))
+    try:
+        start = int(first) if first else None
+        end = int(last) if last else None
+    except ValueError:
+        return None
+    if start is None:
+        if end is None:
+            return None
+        start, end = max(size - end, 0), size - 1  # suffix range: last N bytes
+    else:
+        if end is not None and end < start:
+            return None  # invalid byte-range-spec: the Range header is ignored (RFC 9110 14.1.1)
+        end = size - 1 if end is None else min(end, size - 1)
+    if start >= size or start > end:
+        raise ValueError("unsatisfiable range")
+    return start, end
+
+
+def if_range_matches(if_range: str | None, head: dict) -> bool:
+    # If-Range: apply the Range only if the validator still matches the object
+    if not if_range:
+        return True
+    if if_range.startswith('"') or if_range.startswith("W/"):
+        return if_range == head.get("ETag")  # strong comparison only
+    try:
+        since = parsedate_to_datetime(if_range)
+    except (TypeError, ValueError):
+        return False
+    modified = head.get("LastModified")
+    return modified is not None and int(modified.timestamp()) == int(since.timestamp())
+
+
+def object_max_age(login: str, path: str) -> int:
+    # max-age of an object of this tenant (path relative to the tenant root)
+    path = path.lstrip("/")
+    for rule_login, prefix, max_age in OBJECT_CACHE_RULES:
+        if (not rule_login or rule_login == login) and path.startswith(prefix):
+            return max_age
+    return OBJECT_CACHE_MAX_AGE
+
+
+def object_cache_headers(head: dict, max_age: int = OBJECT_CACHE_MAX_AGE) -> dict[str, str]:
+    # validators of the S3 object instead of the blanket no-store; "private" keeps shared
+    # caches out, and revalidation always runs under the current session/tenant
+    headers = {"Cache-Control": f"private, max-age={max_age}, must-revalidate"}
+    if head.get("ETag"):
+        headers["ETag"] = head["ETag"]
+    if head.get("LastModified"):
+        headers["Last-Modified"] = http_date(head["LastModified"])
+    return headers
+
+
+def content_disposition(kind: str, filename: str) -> str:
+    # ASCII fallback + RFC 5987 filename* (header values must stay latin-1)
+    fallback = secure_filename(filename) or "download"
+    return f"{kind}; filename=\"{fallback}\"; filename*=UTF-8''{quote(filename)}"
+
+
+def use_presigned(request: Request, filename: str, size: int) -> bool:
+    # fetch() of the previews (Sec-Fetch-Mode: cors) would need CORS on the bucket to follow a
+    # cross-origin redirect, so those keep going through the app
+    if request.headers.get("sec-fetch-mode") == "cors":
+        return False
+    return (
+        PRESIGNED_DELIVERY
+        or (PRESIGNED_MIN_SIZE >= 0 and size >= PRESIGNED_MIN_SIZE)
+        or Path(filename).suffix[1:].lower() in PRESIGNED_EXTENSIONS
+    )
+
+
+def not_modified(request: Request, head: dict) -> bool:
+    # If-None-Match wins over If-Modified-Since (RFC 9110)
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        etag = (head.get("ETag") or "").removeprefix("W/")
+        tags = [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+        return "*" in tags or (bool(etag) and etag in tags)
+    if_modified_since = request.headers.get("if-modified-since")
+    modified = head.get("LastModified")
+    if if_modified_since and modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        return int(modified.timestamp()) <= int(since.timestamp())
+    return False
+
+
 def render(request: Request, template_name: str, **context) -> HTMLResponse:
     return templates.TemplateResponse(template_name, {"request": request, **context})
 
@@ -176,87 +320,68 @@ def session_ctx(session: dict = Depends(require_login)) -> dict:
 # Sorting / directory listing helpers
 # ------------------------------------------------------------------------------
 
+def sort_key(sort_by_selected: int):
+    # f_url breaks ties, so the key identifies a row (and can be carried by a listing cursor)
+    if sort_by_selected == 0:
+        return lambda x: (x.f.lower(), x.obj)
+    if sort_by_selected == 1:
+        return lambda x: (x.filetype, x.obj)
+    if sort_by_selected == 2:
+        return lambda x: (x.dtm_b.timestamp(), x.obj)
+    return lambda x: (x.size_b, x.obj)
+
+
 def sort_structure(session: dict, all_dir: list[dict]) -> list[dict]:
     sort_by_selected = session.get("sort_by_selected", 0)
     sort_order = session.get("sort_order", 0)
+    return sorted(all_dir, key=sort_key(sort_by_selected), reverse=bool(sort_order))
 
-    reverse = bool(sort_order)
 
-    if sort_by_selected == 0:
-        return sorted(all_dir, key=lambda x: x["f"].lower(), reverse=reverse)
-    if sort_by_selected == 1:
-        return sorted(all_dir, key=lambda x: x.get("filetype", ""), reverse=reverse)
-    if sort_by_selected == 2:
-        return sorted(all_dir, key=lambda x: x.get("dtm_b"), reverse=reverse)
-    return sorted(all_dir, key=lambda x: x.get("size_b", 0), reverse=reverse)
-
-
-def getDirList(session: dict, curDir: str, listdir: list[dict]) -> list[dict]:
-    all_dir: list[dict] = []
-
-    # folders first
-    for i in [dList for dList in listdir if dList.get("isdir", False)]:
-        dots = "..." if len(i.get("name", "")) > maxFileNameLength else ""
-        temp_dir = {
-            "f": i["name"][0:maxFileNameLength] + dots,
-            "f_url": i["obj"],
-            "filetype": "",
-            "mediatype": "",
-            "currentDir": curDir,
-            "system": i.get("system", False),
-            "isdir": i.get("isdir", False),
-            "icon": "fa fa-folder",
-            "user": i.get("user", ""),
-            "dtm": "",
-            "dtm_b": datetime(2025, 1, 1, tzinfo=timezone.utc),
-            "size": "---",
-            "size_b": 0,
-        }
-        if i["name"] not in [".", ".."]:
-            all_dir.append(temp_dir)
-
-    # files
-    for i in [dList for dList in listdir if not dList.get("isdir", False)]:
-        icon = None
-        mediatype = ""
-        tp = i.get("type")
-        for k, file_type in tp_dict.items():
-            if tp in file_type[0]:
-                mediatype = k
-                icon = file_type[1]
-                break
-        if not icon:
-            icon = "fa fa-file"
-
-        dots = "..." if len(i.get("name", "")) > maxFileNameLength else ""
-        filesizeK = i.get("size", 0) / 1024.0
-
-        modified_dt = i.get("modified", datetime.now(timezone.utc))
-        if getattr(modified_dt, "tzinfo", None) is None:
-            modified_dt = modified_dt.replace(tzinfo=timezone.utc)
-
-        temp_file = {
-            "f": i["name"][0:maxFileNameLength] + dots,
-            "filetype": i.get("type", ""),
-            "mediatype": mediatype,
-            "f_url": i["obj"],
-            "currentDir": curDir,
-            "system": i.get("system", False),
-            "isdir": i.get("isdir", False),
-            "icon": icon,
-            "user": i.get("user", ""),
-            "dtm": modified_dt.strftime("%d/%m/%Y %H:%M:%S"),
-            "dtm_b": modified_dt,
-            "size": ("%.2fK" % filesizeK)
-            if filesizeK < 1000
-            else ("%.2fM" % (filesizeK / 1024))
-            if (filesizeK / 1024) < 1000
-            else ("%.2fG" % (filesizeK / 1024 / 1024)),
-            "size_b": i.get("size", 0),
-        }
-        all_dir.append(temp_file)
-
-    return sort_structure(session, all_dir)
+def getDirList(session: dict, curDir: str, listdir: list[dal_entry.Entry]) -> list[dal_entry.Entry]:
+    return sort_structure(session, dir_entries(curDir, listdir))
+
+
+def dir_entries(curDir: str, listdir: list[dal_entry.Entry]) -> list[dal_entry.Entry]:
+    # the dal entries are rendered as they are (display fields are computed per shown row)
+    return [i for i in listdir if i.name not in (".", "..") or not i.isdir]
+
+
+# ------------------------------------------------------------------------------
+# Paginated listing: the folder is sorted once per listing snapshot (cached with the listing,
+# invalidated by writes); pages are slices after the sort key of the last row sent (keyset
+# cursor), so a cursor still works on another worker or after the snapshot is rebuilt.
+# ------------------------------------------------------------------------------
+
+list_cursors = URLSafeSerializer(SESSION_SECRET, salt="list-cursor")
+LIST_ROW_FIELDS = ("f", "f_url", "filetype", "mediatype", "system", "isdir", "icon", "user", "dtm", "size")
+
+
+async def listing_snapshot(wasabi: ctl_wasabi.AsyncWasabi, var: str, sort_by_selected: int) -> tuple[list, list]:
+    # (entries in ascending key order, their keys)
+    def build(listdir: list[dict]) -> tuple[list, list]:
+        key = sort_key(sort_by_selected)
+        entries = sorted(dir_entries(var, listdir), key=key)
+        return entries, [key(e) for e in entries]
+
+    return await wasabi.listing_view(var, ("sorted", sort_by_selected), build)
+
+
+def listing_page(snapshot: tuple[list, list], descending: bool, after: tuple | None, limit: int) -> tuple[list, tuple | None]:
+    # rows after `after` in the requested direction + the key to continue from (None = last page)
+    entries, keys = snapshot
+    if not descending:
+        start = bisect.bisect_right(keys, after) if after is not None else 0
+        end = min(start + limit, len(entries))
+        return entries[start:end], (keys[end - 1] if end < len(entries) else None)
+    end = bisect.bisect_left(keys, after) if after is not None else len(entries)
+    start = max(end - limit, 0)
+    return entries[start:end][::-1], (keys[start] if start > 0 else None)
+
+
+def list_cursor(var: str, ctx: dict, key: tuple | None) -> str:
+    if key is None:
+        return ""
+    return list_cursors.dumps({"d": var, "s": ctx["sort_by_selected"], "o": ctx["sort_order"], "k": list(key)})
 
 
 # ------------------------------------------------------------------------------
@@ -307,7 +432,7 @@ async def login_get(request: Request, var: str):
             request.session["sort_by_selected"] = 0
             request.session["sort_order"] = 0
 
-            ctl_wasabi.Wasabi(request.session["login"]).initialize_folder()
+            await ctl_wasabi.AsyncWasabi(request.session["login"]).initialize_folder()
             return redirect("/files/")
     except Exception:
         pass
@@ -371,17 +496,18 @@ async def toggle_sort(request: Request, ctx: dict = Depends(session_ctx), col: s
 @app.get("/move")
 async def move(request: Request, ctx: dict = Depends(session_ctx), from_: str = "", to_: str = ""):
     if from_ and to_ and to_ != "null" and (from_ not in to_):
-        wasabi = ctl_wasabi.Wasabi(ctx["login"])
+        wasabi = ctl_wasabi.AsyncWasabi(ctx["login"])
         if from_.endswith("/"):
             if to_ == "/":
                 to_ = ""
             directory_path = Path(from_)
-            wasabi.move_folder(from_, to_ + directory_path.name + "/")
-            return PlainTextResponse("/files/" + to_)
+            # roda em segundo plano; a página de destino acompanha o job
+            job_id = await anyio.to_thread.run_sync(lambda: ctl_jobs.submit("move_folder", ctx["login"], old_path=from_, new_path=to_ + directory_path.name + "/"))
+            return PlainTextResponse(f"/files/{to_}?job={job_id}")
         else:
             directory_path = Path(from_)
             dir_ = str(directory_path.parents[0]) if len(directory_path.parents) > 1 else "/"
-            ok = wasabi.move_file(origin_subfolder_path=dir_, dest_subfolder_path=to_, filename=directory_path.name)
+            ok = await wasabi.move_file(origin_subfolder_path=dir_, dest_subfolder_path=to_, filename=directory_path.name)
             return PlainTextResponse("OK" if ok else "NOK")
     return PlainTextResponse("OK")
 
@@ -393,13 +519,15 @@ async def rename(request: Request, var: str, ctx: dict = Depends(session_ctx), n
     new_name = name
 
     if new_name and obj and old_name not in ctl_wasabi.diretorios_sistema:
-        wasabi = ctl_wasabi.Wasabi(ctx["login"])
+        wasabi = ctl_wasabi.AsyncWasabi(ctx["login"])
         if obj == "folder":
-            ok = wasabi.move_folder(old_name, old_name.replace(directory_path.name, new_name))
+            dir_ = str(directory_path.parents[0]) + "/" if len(directory_path.parents) > 1 else ""
+            job_id = await anyio.to_thread.run_sync(lambda: ctl_jobs.submit("move_folder", ctx["login"], old_path=old_name, new_path=old_name.replace(directory_path.name, new_name)))
+            return PlainTextResponse(f"/files/{dir_}?job={job_id}")
         elif obj == "file":
             dir_ = str(directory_path.parents[0]) if len(directory_path.parents) > 1 else "/"
             new_name += directory_path.suffix
-            ok = wasabi.rename_file(subfolder_path=dir_, filename=directory_path.name, new_filename=new_name)
+            ok = await wasabi.rename_file(subfolder_path=dir_, filename=directory_path.name, new_filename=new_name)
         else:
             ok = True
         return PlainTextResponse("OK" if ok else "NOK")
@@ -410,8 +538,9 @@ async def rename(request: Request, var: str, ctx: dict = Depends(session_ctx), n
 @app.get("/files/{var:path}", response_class=HTMLResponse)
 async def file_page(request: Request, var: str = "", ctx: dict = Depends(session_ctx)):
     breadcrumb: list[list[str]] = []
-    wasabi = ctl_wasabi.Wasabi(ctx["login"])
-    dir_content = getDirList(request.session, var, wasabi.list_folder(var))
+    wasabi = ctl_wasabi.AsyncWasabi(ctx["login"])
+    snapshot = await listing_snapshot(wasabi, var, ctx["sort_by_selected"])
+    dir_content, next_key = listing_page(snapshot, bool(ctx["sort_order"]), None, LIST_PAGE_SIZE)
 
     cList = "" if not var else (var[:-1].split("/") if var.endswith("/") else var.split("/"))
     home_page = "Área do Cliente" if "Área do Cliente" in ctx["login"] else "Home"
@@ -431,25 +560,62 @@ async def file_page(request: Request, var: str = "", ctx: dict = Depends(session
             "header":ctx["title"],
             "currentDir":var,
             "breadcrumb":breadcrumb,
-            "all_dir":dir_content
+            "all_dir":dir_content,
+            "next_cursor":list_cursor(var, ctx, next_key),
         })
+
+
+@app.get("/api/list/", response_class=JSONResponse)
+@app.get("/api/list/{var:path}", response_class=JSONResponse)
+async def api_list(var: str = "", cursor: str = "", limit: int = LIST_PAGE_SIZE, ctx: dict = Depends(session_ctx)):
+    after = None
+    if cursor:
+        try:
+            c = list_cursors.loads(cursor)
+        except BadSignature:
+            c = {}
+        # cursor of another folder/sort order: the client must reload the page
+        if c.get("d") != var or c.get("s") != ctx["sort_by_selected"] or c.get("o") != ctx["sort_order"]:
+            return JSONResponse({"ok": False, "error": "Cursor inválido"}, status_code=409)
+        after = tuple(c["k"])
+
+    snapshot = await listing_snapshot(ctl_wasabi.AsyncWasabi(ctx["login"]), var, ctx["sort_by_selected"])
+    rows, next_key = listing_page(snapshot, bool(ctx["sort_order"]), after, max(1, min(limit, 1000)))
+    return {
+        "ok": True,
+        "rows": [{k: getattr(r, k) for k in LIST_ROW_FIELDS} for r in rows],
+        "next": list_cursor(var, ctx, next_key),
+        "total": len(snapshot[0]),
+    }
     
     #resp.headers.update(nocache_headers())
     #return resp
 
 
-@app.post("/find/", response_class=HTMLResponse)
-@app.post("/find/{var:path}", response_class=HTMLResponse)
+@app.api_route("/find/", methods=["GET", "POST"], response_class=HTMLResponse)
+@app.api_route("/find/{var:path}", methods=["GET", "POST"], response_class=HTMLResponse)
 async def find(request: Request, var: str = "", ctx: dict = Depends(session_ctx)):
-    form = await request.form()
-    name = form.get("search_name", "")
-
-    wasabi = ctl_wasabi.Wasabi(ctx["login"])
+    # POST vem do formulário; as páginas seguintes são GET ?search_name=...&page=N
+    if request.method == "POST":
+        form = await request.form()
+        name = form.get("search_name", "")
+    else:
+        name = request.query_params.get("search_name", "")
+    try:
+        page = max(int(request.query_params.get("page", "1")), 1)
+    except ValueError:
+        page = 1
+
+    wasabi = ctl_wasabi.AsyncWasabi(ctx["login"])
+    # uma linha a mais só para saber se existe próxima página
+    found = await wasabi.find_file(folder_path=var, searched_name=name,
+                                   offset=(page - 1) * ctl_wasabi.FIND_PAGE_SIZE, limit=ctl_wasabi.FIND_PAGE_SIZE + 1)
     dir_content = getDirList(
         request.session,
         var,
-        wasabi.find_file(folder_path=var, searched_name=name),
+        found[:ctl_wasabi.FIND_PAGE_SIZE],
     )
+    page_url = f"/find/{quote(var)}?search_name={quote(name)}&page="
 
     breadcrumb: list[list[str]] = []
     cList = "" if not var else (var[:-1].split("/") if var.endswith("/") else var.split("/"))
@@ -472,6 +638,8 @@ async def find(request: Request, var: str = "", ctx: dict = Depends(session_ctx)
         currentDir="",
         breadcrumb=breadcrumb,
         all_dir=dir_content,
+        prev_page=f"{page_url}{page - 1}" if page > 1 else "",
+        next_page=f"{page_url}{page + 1}" if len(found) > ctl_wasabi.FIND_PAGE_SIZE else "",
     )
     resp.headers.update(nocache_headers())
     return resp
@@ -482,29 +650,112 @@ async def home_page(request: Request, ctx: dict = Depends(session_ctx)):
     return redirect("/files/")
 
 
-@app.get("/browse/{var:path}")
-@app.get("/download/{var:path}")
+@app.api_route("/browse/{var:path}", methods=["GET", "HEAD"])
+@app.api_route("/download/{var:path}", methods=["GET", "HEAD"])
 async def browse_or_download(request: Request, var: str, ctx: dict = Depends(session_ctx)):
+    return await serve_object(request, var, ctx)
+
+
+async def serve_object(request: Request, var: str, ctx: dict, retry: bool = True):
     download = request.url.path.startswith("/download/")
     directory_path = Path(var)
     dir_ = str(directory_path.parents[0]) if len(directory_path.parents) > 1 else "/"
 
-    wasabi = ctl_wasabi.Wasabi(ctx["login"])
-    obj = wasabi.get_object(dir_, directory_path.name)
-    if not obj:
+    wasabi = ctl_wasabi.AsyncWasabi(ctx["login"])
+    head = await wasabi.head_object(dir_, directory_path.name)
+    if not head:
         raise StarletteHTTPException(status_code=404, detail="Object not found")
 
-    byte_stream = obj["Body"]  # boto StreamingBody (file-like)
+    if not_modified(request, head):
+        # answered from the HEAD alone, the object body is never opened
+        return Response(status_code=304, headers=object_cache_headers(head, object_max_age(ctx["login"], var)))
+
+    size = head["ContentLength"]
     media_type = get_mime_type(directory_path.suffix[1:]) or "application/octet-stream"
 
+    if use_presigned(request, directory_path.name, size):
+        # Range/If-Range are resent by the browser to the presigned URL and answered by Wasabi
+        url = await wasabi.presigned_url(
+            dir_,
+            directory_path.name,
+            PRESIGNED_EXPIRES,
+            content_disposition=content_disposition("attachment" if download else "inline", directory_path.name),
+            content_type=media_type,
+        )
+        return RedirectResponse(url=url, status_code=302, headers={"Cache-Control": "no-store"})
+
     headers = {}
-    headers["Content-Disposition"] = (
-        f'attachment; filename="{directory_path.name}"' if download else f'inline; filename="{directory_path.name}"'
-    )
+    headers["Content-Disposition"] = content_disposition("attachment" if download else "inline", directory_path.name)
+    headers["Accept-Ranges"] = "bytes"
+
+    byte_range = None
+    if if_range_matches(request.headers.get("if-range"), head):
+        try:
+            byte_range = parse_range(request.headers.get("range"), size)
+        except ValueError:
+            headers["Content-Range"] = f"bytes */{size}"
+            return Response(status_code=416, headers=headers)
+
+    status_code = 200
+    length = size
+    if byte_range:
+        start, end = byte_range
+        status_code = 206
+        length = end - start + 1
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(length)
+
+    headers.update(object_cache_headers(head, object_max_age(ctx["login"], var)))
+
+    if request.method == "HEAD":
+        return Response(status_code=status_code, media_type=media_type, headers=headers)
+
+    try:
+        # the GET must be the object the (cached) HEAD described: length, range and validators
+        obj = await wasabi.get_object(dir_, directory_path.name, f"bytes={start}-{end}" if byte_range else None, if_match=head["ETag"])
+    except dal_wasabi.ObjectChanged:
+        # overwritten outside the app since the HEAD was cached: start over with a fresh HEAD
+        await wasabi.forget_head(dir_, directory_path.name)
+        if retry:
+            return await serve_object(request, var, ctx, retry=False)
+        raise StarletteHTTPException(status_code=503, detail="Object changed during the request", headers={"Retry-After": "1"})
+    if not obj:
+        raise StarletteHTTPException(status_code=404, detail="Object not found")
+
+    # corpo lido em blocos grandes fora do event loop, com read-ahead limitado
+    byte_stream = ctl_wasabi.BodyStream(obj["Body"], name=var, owner=ctx["login"])
+    return StreamingResponse(byte_stream, status_code=status_code, media_type=media_type, headers=headers)
+
+@app.get("/thumb/{var:path}")
+async def thumb(request: Request, var: str, size: int = 256, ctx: dict = Depends(session_ctx)):
+    """Image rendition (max side `size`, WebP when accepted); falls back to the original."""
+    directory_path = Path(var)
+    dir_ = str(directory_path.parents[0]) if len(directory_path.parents) > 1 else "/"
+    if not ctl_thumb.supported(directory_path.name):
+        return redirect("/browse/" + quote(var))
+
+    wasabi = ctl_wasabi.Wasabi(ctx["login"])
+    head = await ctl_wasabi.run_s3(wasabi.head_object, dir_, directory_path.name)
+    if not head:
+        raise StarletteHTTPException(status_code=404, detail="Object not found")
+
+    size = ctl_thumb.thumb_size(size)
+    fmt = ctl_thumb.thumb_format(request.headers.get("accept"))
+    rendition = {"ETag": f'"{head["ETag"].strip(chr(34))}-{size}-{fmt}"', "LastModified": head.get("LastModified")}
+    headers = object_cache_headers(rendition, object_max_age(ctx["login"], var))
+    headers["Vary"] = "Accept"
+    if not_modified(request, rendition):
+        return Response(status_code=304, headers=headers)
+
+    try:
+        path = await ctl_thumb.thumbnail(wasabi, dir_, directory_path.name, head, size, fmt)
+    except Exception:
+        path = None
+    if not path:
+        # grande demais / não decodificável: entrega o original
+        return redirect("/browse/" + quote(var))
+    return FileResponse(path, media_type=f"image/{fmt}", headers=headers)
 
-    resp = StreamingResponse(byte_stream, media_type=media_type, headers=headers)
-    resp.headers.update(nocache_headers())
-    return resp
 
 @app.get("/pptpdf/{var:path}")
 async def ppt_to_pdf(
@@ -514,7 +765,7 @@ async def ppt_to_pdf(
 ):
     """
     Converte PPT/PPTX para PDF via LibreOffice (headless) e retorna inline.
-    Ubuntu / sem cache.
+    Conversões ficam em cache por (objeto, ETag); ver ctl_convert.
     """
 
     path = Path(var)
@@ -527,117 +778,60 @@ async def ppt_to_pdf(
     dir_ = str(path.parents[0]) if len(path.parents) > 1 else "/"
 
     wasabi = ctl_wasabi.Wasabi(ctx["login"])
-    obj = wasabi.get_object(dir_, path.name)
-    if not obj:
-        raise StarletteHTTPException(status_code=404, detail="Arquivo não encontrado")
-
-    tmpdir = tempfile.mkdtemp(prefix="pptpdf_")
-
     try:
-        src_path = Path(tmpdir) / path.name
-        out_dir = Path(tmpdir)
-
-        # salva o PPT/PPTX localmente
-        body = obj["Body"]
-        with open(src_path, "wb") as f:
-            f.write(body.read())
-
-        # profile isolado do LibreOffice
-        user_profile = Path(tmpdir) / "lo_profile"
-
-        # ambiente controlado (evita javaldx)
-        env = os.environ.copy()
-        env["SAL_USE_VCLPLUGIN"] = "svp"
-        env["JAVA_HOME"] = ""
-        env["JRE_HOME"] = ""
-
-        cmd = [
-            "soffice",
-            f"-env:UserInstallation=file://{user_profile.as_posix()}",
-            "--headless",
-            "--invisible",
-            "--nologo",
-            "--nofirststartwizard",
-            "--norestore",
-            "--convert-to", "pdf",
-            "--outdir", str(out_dir),
-            str(src_path),
-        ]
-
-        def _run():
-            return subprocess.run(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                env=env,
-                check=False,
-                timeout=60,  # evita travar
-            )
-
-        res = await anyio.to_thread.run_sync(_run)
-
-        pdf_path = out_dir / (src_path.stem + ".pdf")
-
-        if not pdf_path.exists():
-            err = (res.stderr or b"").decode("utf-8", "ignore")
-            raise StarletteHTTPException(
-                status_code=500,
-                detail="Falha ao converter PPT/PPTX para PDF: " + err[:500],
-            )
-
-        headers = {
-            "Content-Disposition": f'inline; filename="{src_path.stem}.pdf"'
-        }
-
-        resp = FileResponse(
-            str(pdf_path),
-            media_type="application/pdf",
-            headers=headers,
+        pdf_path = await ctl_convert.ppt_to_pdf_async(wasabi, dir_, path.name)
+    except ctl_convert.ConversionBusy as e:
+        raise StarletteHTTPException(
+            status_code=503,
+            detail="Conversor ocupado, tente novamente: " + str(e),
+            headers={"Retry-After": "10"},
         )
+    except ctl_convert.ConversionError as e:
+        raise StarletteHTTPException(
+            status_code=500,
+            detail="Falha ao converter PPT/PPTX para PDF: " + str(e),
+        )
+    if not pdf_path:
+        raise StarletteHTTPException(status_code=404, detail="Arquivo não encontrado")
 
-        # mantém o mesmo comportamento de no-cache do /browse
-        resp.headers["Cache-Control"] = "no-store, no-cache, must-revalidate, max-age=0"
-        resp.headers["Pragma"] = "no-cache"
-        resp.headers["Expires"] = "0"
+    headers = {"Content-Disposition": content_disposition("inline", f"{path.stem}.pdf")}
 
-        return resp
+    resp = FileResponse(
+        pdf_path,
+        media_type="application/pdf",
+        headers=headers,
+    )
 
-    finally:
-        shutil.rmtree(tmpdir, ignore_errors=True)
+    # mantém o mesmo comportamento de no-cache do /browse
+    resp.headers["Cache-Control"] = "no-store, no-cache, must-revalidate, max-age=0"
+    resp.headers["Pragma"] = "no-cache"
+    resp.headers["Expires"] = "0"
+
+    return resp
 
 
 @app.get("/delete/{var:path}")
 async def delete_file(request: Request, var: str, ctx: dict = Depends(session_ctx)):
     directory_path = Path(var)
     dir_ = str(directory_path.parents[0]) if len(directory_path.parents) > 1 else "/"
-    ctl_wasabi.Wasabi(ctx["login"]).delete(bucket_dir=dir_, file_name=directory_path.name)
+    await ctl_wasabi.AsyncWasabi(ctx["login"]).delete(bucket_dir=dir_, file_name=directory_path.name)
     return redirect("/files" + (dir_ if dir_.startswith("/") else "/" + dir_))
 
 
 @app.get("/downloadFolder/")
 @app.get("/downloadFolder/{var:path}")
-async def download_folder(request: Request, var: str = "", ctx: dict = Depends(session_ctx)):
+async def download_folder(request: Request, var: str = "", recursive: int = 1, ctx: dict = Depends(session_ctx)):
+    """Streams the folder (and, by default, its subtree) as a ZIP64 archive."""
+    var = var.split("//")[1] if "//" in var else var
     wasabi = ctl_wasabi.Wasabi(ctx["login"])
 
-    dirlist = wasabi.list_folder(var)
-    for f in getDirList(request.session, var, dirlist):
-        if not f["isdir"]:
-            directory_path = Path(f["f_url"])
-            dir_ = str(directory_path.parents[0]) if len(directory_path.parents) > 1 else "/"
+    folder_name = Path(var).name or ("Área do Cliente" if "Área do Cliente" in ctx["login"] else "Home")
+    zip_name = f"{folder_name}.zip"
+    headers = {"Content-Disposition": content_disposition("attachment", zip_name)}
 
-            obj = wasabi.get_object(dir_, directory_path.name)
-            if not obj:
-                continue
-
-            byte_stream = obj["Body"]
-            media_type = get_mime_type(directory_path.suffix[1:]) or "application/octet-stream"
-            headers = {"Content-Disposition": f'attachment; filename="{directory_path.name}"'}
-
-            resp = StreamingResponse(byte_stream, media_type=media_type, headers=headers)
-            resp.headers.update(nocache_headers())
-            return resp
-
-    return redirect("/files/" + var)
+    resp = StreamingResponse(wasabi.zip_folder(var, recursive=bool(recursive)), media_type="application/zip", headers=headers)
+    resp.headers.update(nocache_headers())
+    return resp
 
 
 @app.get("/deleteFolder/")
@@ -646,8 +840,83 @@ async def delete_folder(request: Request, var: str = "", ctx: dict = Depends(ses
     var = var.split("//")[1] if "//" in var else var
     directory_path = Path(var)
     dir_ = str(directory_path.parents[0]) if len(directory_path.parents) > 1 else ""
-    ctl_wasabi.Wasabi(ctx["login"]).delete_folder(var)
-    return redirect("/files/" + dir_)
+    job_id = await anyio.to_thread.run_sync(lambda: ctl_jobs.submit("delete_folder", ctx["login"], path=var))
+    return redirect(f"/files/{dir_}?job={job_id}")
+
+
+# ------------------------------------------------------------------------------
+# Background jobs (move/rename/delete of folders, folder size)
+# ------------------------------------------------------------------------------
+JOB_FIELDS = ("id", "kind", "params", "state", "stage", "done", "total", "result", "error", "attempts", "created_at", "updated_at")
+
+
+def job_view(job: dict) -> dict:
+    return {k: job[k] for k in JOB_FIELDS}
+
+
+@app.post("/api/size/", response_class=JSONResponse)
+@app.post("/api/size/{var:path}", response_class=JSONResponse)
+async def api_size(var: str = "", ctx: dict = Depends(session_ctx)):
+    var = var.split("//")[1] if "//" in var else var
+    job_id = await anyio.to_thread.run_sync(lambda: ctl_jobs.submit("size_folder", ctx["login"], path=var))
+    return {"ok": True, "job": job_id}
+
+
+@app.get("/api/jobs/", response_class=JSONResponse)
+async def api_jobs(ctx: dict = Depends(session_ctx)):
+    jobs = await anyio.to_thread.run_sync(ctl_jobs.list_jobs, ctx["login"])
+    return {"ok": True, "jobs": [job_view(j) for j in jobs]}
+
+
+@app.get("/api/jobs/{job_id}", response_class=JSONResponse)
+async def api_job(job_id: str, ctx: dict = Depends(session_ctx)):
+    job = await anyio.to_thread.run_sync(ctl_jobs.get, job_id, ctx["login"])
+    if not job:
+        return JSONResponse({"ok": False, "error": "Job não encontrado"}, status_code=404)
+    return {"ok": True, "job": job_view(job)}
+
+
+@app.get("/api/jobs/{job_id}/events")
+async def api_job_events(job_id: str, ctx: dict = Depends(session_ctx)):
+    # Server-Sent Events: um evento a cada mudança, até o job terminar
+    job = await anyio.to_thread.run_sync(ctl_jobs.get, job_id, ctx["login"])
+    if not job:
+        return JSONResponse({"ok": False, "error": "Job não encontrado"}, status_code=404)
+
+    async def events():
+        last = None
+        current = job
+        while True:
+            view = job_view(current)
+            if view != last:
+                yield f"data: {json.dumps(view)}\n\n"
+                last = view
+            if current["state"] in dal_jobs.FINISHED:
+                return
+            await anyio.sleep(1)
+            current = await anyio.to_thread.run_sync(ctl_jobs.get, job_id, ctx["login"])
+
+    headers = nocache_headers()
+    headers["X-Accel-Buffering"] = "no"
+    return StreamingResponse(events(), media_type="text/event-stream", headers=headers)
+
+
+@app.post("/api/jobs/{job_id}/cancel", response_class=JSONResponse)
+async def api_job_cancel(job_id: str, ctx: dict = Depends(session_ctx)):
+    ok = await anyio.to_thread.run_sync(ctl_jobs.cancel, job_id, ctx["login"])
+    return JSONResponse({"ok": ok}, status_code=200 if ok else 409)
+
+
+@app.post("/api/jobs/{job_id}/resume", response_class=JSONResponse)
+async def api_job_resume(job_id: str, ctx: dict = Depends(session_ctx)):
+    ok = await anyio.to_thread.run_sync(ctl_jobs.resume, job_id, ctx["login"])
+    return JSONResponse({"ok": ok}, status_code=200 if ok else 409)
+
+
+@app.get("/api/streams/", response_class=JSONResponse)
+async def api_streams(ctx: dict = Depends(session_ctx)):
+    # vazão dos downloads do usuário atendidos por este worker
+    return {"ok": True, **ctl_wasabi.stream_stats(ctx["login"])}
 
 
 @app.post("/api/upload/", response_class=JSONResponse)
@@ -662,11 +931,10 @@ async def api_upload_file(var: str = "", file: UploadFile = File(...), ctx: dict
     if is_executable(safe_name):
         return JSONResponse({"ok": False, "error": "Nome de arquivo inválido"}, status_code=400)
     
-    wasabi = ctl_wasabi.Wasabi(ctx["login"])
+    wasabi = ctl_wasabi.AsyncWasabi(ctx["login"])
 
     try:
-        w = await anyio.to_thread.run_sync(
-            wasabi.put_object,
+        w = await wasabi.put_object(
             var,
             safe_name.rstrip(),
             file.file,
@@ -676,6 +944,7 @@ async def api_upload_file(var: str = "", file: UploadFile = File(...), ctx: dict
         ok = status in (200, 204)
         if not ok:
             return JSONResponse({"ok": False, "name": safe_name, "error": f"HTTPStatusCode={status}"}, status_code=500)
+        ctl_thumb.warm(wasabi.wasabi, var, safe_name.rstrip())
         return {"ok": True, "name": safe_name, "path": (var + safe_name) if var else safe_name}
     except Exception as e:
         return JSONResponse({"ok": False, "name": safe_name, "error": str(e)}, status_code=500)
@@ -686,6 +955,167 @@ async def api_upload_file(var: str = "", file: UploadFile = File(...), ctx: dict
             pass
 
 
+# ------------------------------------------------------------------------------
+# Chunked / resumable upload (init -> PUT chunks -> status -> complete)
+# ------------------------------------------------------------------------------
+
+upload_tokens = URLSafeSerializer(SESSION_SECRET, salt="chunked-upload")
+
+
+def upload_chunks_count(size: int, chunk_size: int) -> int:
+    return max(1, -(-size // chunk_size))
+
+
+def load_upload_token(token: str, ctx: dict) -> dict | None:
+    # o token carrega o estado do upload (assinado), assim qualquer worker atende qualquer chunk
+    try:
+        up = upload_tokens.loads(token)
+    except BadSignature:
+        return None
+    return up if up.get("login") == ctx["login"] else None
+
+
+@app.post("/api/chunked/init/", response_class=JSONResponse)
+@app.post("/api/chunked/init/{var:path}", response_class=JSONResponse)
+async def api_chunked_init(request: Request, var: str = "", ctx: dict = Depends(session_ctx)):
+    var = var.split("//")[1] if "//" in var else var
+    data = await request.json()
+    safe_name = secure_filename(data.get("name") or "").rstrip()
+    if not safe_name or is_executable(safe_name):
+        return JSONResponse({"ok": False, "error": "Nome de arquivo inválido"}, status_code=400)
+    try:
+        size = int(data.get("size", 0))
+    except (TypeError, ValueError):
+        size = -1
+    if size < 0 or size > MAX_CONTENT_LENGTH:
+        return JSONResponse({"ok": False, "name": safe_name, "error": "Tamanho inválido"}, status_code=413)
+
+    try:
+        upload_id = await ctl_wasabi.AsyncWasabi(ctx["login"]).start_upload(var, safe_name)
+    except Exception as e:
+        return JSONResponse({"ok": False, "name": safe_name, "error": str(e)}, status_code=500)
+
+    token = upload_tokens.dumps({
+        "login": ctx["login"],
+        "dir": var,
+        "name": safe_name,
+        "upload_id": upload_id,
+        "size": size,
+        "chunk_size": UPLOAD_CHUNK_SIZE,
+        "direct": DIRECT_UPLOAD,
+    })
+    return {
+        "ok": True,
+        "token": token,
+        "name": safe_name,
+        "chunk_size": UPLOAD_CHUNK_SIZE,
+        "chunks": upload_chunks_count(size, UPLOAD_CHUNK_SIZE),
+        "direct": DIRECT_UPLOAD,
+        "parts": [],
+    }
+
+
+@app.get("/api/chunked/{token}", response_class=JSONResponse)
+async def api_chunked_status(token: str, ctx: dict = Depends(session_ctx)):
+    up = load_upload_token(token, ctx)
+    if not up:
+        return JSONResponse({"ok": False, "error": "Upload inválido"}, status_code=400)
+    try:
+        parts = await ctl_wasabi.AsyncWasabi(ctx["login"]).uploaded_chunks(up["dir"], up["name"], up["upload_id"])
+    except Exception as e:
+        # upload expirado/abortado: o cliente deve reiniciar
+        return JSONResponse({"ok": False, "name": up["name"], "error": str(e)}, status_code=404)
+    return {
+        "ok": True,
+        "name": up["name"],
+        "chunk_size": up["chunk_size"],
+        "chunks": upload_chunks_count(up["size"], up["chunk_size"]),
+        "direct": up.get("direct", False),
+        "parts": sorted(p["PartNumber"] for p in parts),
+    }
+
+
+@app.post("/api/chunked/{token}/urls", response_class=JSONResponse)
+async def api_chunked_urls(request: Request, token: str, ctx: dict = Depends(session_ctx)):
+    # URLs assinadas das partes pedidas (upload direto ao bucket)
+    up = load_upload_token(token, ctx)
+    if not up or not up.get("direct"):
+        return JSONResponse({"ok": False, "error": "Upload inválido"}, status_code=400)
+    data = await request.json()
+    chunks = upload_chunks_count(up["size"], up["chunk_size"])
+    try:
+        part_numbers = sorted({int(n) for n in data.get("parts", [])})
+    except (TypeError, ValueError):
+        part_numbers = []
+    if not part_numbers or len(part_numbers) > PRESIGNED_UPLOAD_BATCH or part_numbers[0] < 1 or part_numbers[-1] > chunks:
+        return JSONResponse({"ok": False, "error": "Parte inválida"}, status_code=400)
+
+    urls = await ctl_wasabi.AsyncWasabi(ctx["login"]).presigned_chunk_urls(up["dir"], up["name"], up["upload_id"], part_numbers, PRESIGNED_UPLOAD_EXPIRES)
+    return {"ok": True, "urls": urls}
+
+
+@app.put("/api/chunked/{token}/{part_number}", response_class=JSONResponse)
+async def api_chunked_put(request: Request, token: str, part_number: int, ctx: dict = Depends(session_ctx)):
+    up = load_upload_token(token, ctx)
+    if not up:
+        return JSONResponse({"ok": False, "error": "Upload inválido"}, status_code=400)
+
+    chunks = upload_chunks_count(up["size"], up["chunk_size"])
+    if part_number < 1 or part_number > chunks:
+        return JSONResponse({"ok": False, "part": part_number, "error": "Parte inválida"}, status_code=400)
+
+    data = await request.body()
+    expected = up["chunk_size"] if part_number < chunks else up["size"] - (chunks - 1) * up["chunk_size"]
+    if len(data) != expected:
+        return JSONResponse({"ok": False, "part": part_number, "error": "Tamanho da parte inválido"}, status_code=400)
+
+    try:
+        part = await ctl_wasabi.AsyncWasabi(ctx["login"]).upload_chunk(up["dir"], up["name"], up["upload_id"], part_number, data)
+    except Exception as e:
+        return JSONResponse({"ok": False, "part": part_number, "error": str(e)}, status_code=500)
+    return {"ok": True, "part": part_number, "etag": part["ETag"]}
+
+
+@app.post("/api/chunked/{token}/complete", response_class=JSONResponse)
+async def api_chunked_complete(token: str, ctx: dict = Depends(session_ctx)):
+    up = load_upload_token(token, ctx)
+    if not up:
+        return JSONResponse({"ok": False, "error": "Upload inválido"}, status_code=400)
+
+    wasabi = ctl_wasabi.AsyncWasabi(ctx["login"])
+    chunks = upload_chunks_count(up["size"], up["chunk_size"])
+    try:
+        parts = [p for p in await wasabi.uploaded_chunks(up["dir"], up["name"], up["upload_id"]) if p["PartNumber"] <= chunks]
+        missing = sorted(set(range(1, chunks + 1)) - {p["PartNumber"] for p in parts})
+        if missing:
+            return JSONResponse({"ok": False, "name": up["name"], "missing": missing, "error": "Upload incompleto"}, status_code=409)
+        # partes enviadas direto ao bucket não passaram pelo app: confere nome e tamanhos aqui
+        sizes_ok = all(
+            p.get("Size") == (up["chunk_size"] if p["PartNumber"] < chunks else up["size"] - (chunks - 1) * up["chunk_size"])
+            for p in parts
+        )
+        if secure_filename(up["name"]) != up["name"] or is_executable(up["name"]) or not sizes_ok or up["size"] > MAX_CONTENT_LENGTH:
+            await wasabi.abort_upload(up["dir"], up["name"], up["upload_id"])
+            return JSONResponse({"ok": False, "name": up["name"], "error": "Upload recusado"}, status_code=400)
+        await wasabi.complete_upload(up["dir"], up["name"], up["upload_id"], parts, ctx.get("user"))
+        ctl_thumb.warm(wasabi.wasabi, up["dir"], up["name"])
+    except Exception as e:
+        return JSONResponse({"ok": False, "name": up["name"], "error": str(e)}, status_code=500)
+    return {"ok": True, "name": up["name"], "path": (up["dir"] + up["name"]) if up["dir"] else up["name"]}
+
+
+@app.delete("/api/chunked/{token}", response_class=JSONResponse)
+async def api_chunked_abort(token: str, ctx: dict = Depends(session_ctx)):
+    up = load_upload_token(token, ctx)
+    if not up:
+        return JSONResponse({"ok": False, "error": "Upload inválido"}, status_code=400)
+    try:
+        await ctl_wasabi.AsyncWasabi(ctx["login"]).abort_upload(up["dir"], up["name"], up["upload_id"])
+    except Exception as e:
+        return JSONResponse({"ok": False, "name": up["name"], "error": str(e)}, status_code=500)
+    return {"ok": True, "name": up["name"]}
+
+
 @app.api_route("/create/", methods=["GET", "POST"], response_class=HTMLResponse)
 @app.api_route("/create/{var:path}", methods=["GET", "POST"], response_class=HTMLResponse)
 async def create_dir(request: Request, var: str = "", ctx: dict = Depends(session_ctx)):
@@ -694,6 +1124,6 @@ async def create_dir(request: Request, var: str = "", ctx: dict = Depends(sessio
     if request.method == "POST":
         form = await request.form()
         dir_name = (form.get("dir_name", "") or "").rstrip()
-        ctl_wasabi.Wasabi(ctx["login"]).create_folder(var + dir_name.replace("/", "-"))
+        await ctl_wasabi.AsyncWasabi(ctx["login"]).create_folder(var + dir_name.replace("/", "-"))
 
     return redirect("/files/" + var)
@@ -0,0 +1,235 @@
+import asyncio
+import fcntl
+import json
+import os
+import random
+import shutil
+import signal
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from dal import dal_wasabi
+from dal import dal_filecache
+from controllers import ctl_wasabi
+
+# cache das conversões PPT -> PDF: chave (objeto, ETag da origem), então uma apresentação
+# alterada gera nova conversão e a antiga sai pelo LRU
+PPTPDF_CACHE_DIR = os.getenv("PPTPDF_CACHE_DIR", os.path.join(ctl_wasabi.INDEX_DIR, "pptpdf"))
+PPTPDF_CACHE_MAX_BYTES = int(os.getenv("PPTPDF_CACHE_MAX_BYTES", str(2 * 1024 * 1024 * 1024)))
+# prefixo (fora dos roots dos tenants) onde os PDFs são espelhados no bucket para os outros
+# servidores; vazio = só cache local
+PPTPDF_BUCKET_PREFIX = os.getenv("PPTPDF_BUCKET_PREFIX", "")
+# pool de LibreOffice: PPTPDF_WORKERS conversões simultâneas no host (todos os workers do uwsgi),
+# cada slot com um profile já inicializado que é reaproveitado e recriado a cada
+# PPTPDF_RECYCLE_AFTER conversões ou após uma falha. Cada processo deixa no máximo
+# PPTPDF_QUEUE_SIZE pedidos esperando slot; PPTPDF_DEADLINE vale para espera + conversão
+PPTPDF_WORKERS = int(os.getenv("PPTPDF_WORKERS", "2"))
+PPTPDF_QUEUE_SIZE = int(os.getenv("PPTPDF_QUEUE_SIZE", "8"))
+PPTPDF_DEADLINE = float(os.getenv("PPTPDF_DEADLINE", "90"))
+PPTPDF_RECYCLE_AFTER = int(os.getenv("PPTPDF_RECYCLE_AFTER", "50"))
+PPTPDF_SLOTS_DIR = os.getenv("PPTPDF_SLOTS_DIR", os.path.join(ctl_wasabi.INDEX_DIR, "lo_slots"))
+
+_pdf_cache = dal_filecache.DiskCache(PPTPDF_CACHE_DIR, PPTPDF_CACHE_MAX_BYTES, suffix='.pdf')
+# as conversões (espera por slot + soffice, até PPTPDF_DEADLINE) rodam neste pool, não no
+# S3_EXECUTOR das rotas; só as chamadas ao S3 de dentro delas passam por ele (call_s3)
+_convert_pool = ThreadPoolExecutor(max_workers=PPTPDF_WORKERS + PPTPDF_QUEUE_SIZE, thread_name_prefix="pptpdf")
+
+# uma conversão por chave por vez neste processo; quem chega depois espera e pega o cache
+_key_locks = dal_filecache.KeyLocks()
+
+
+class ConversionError(Exception):
+    pass
+
+
+class ConversionBusy(ConversionError):
+    # fila cheia ou nenhum slot livre dentro do prazo
+    pass
+
+
+def soffice_env() -> dict:
+    # ambiente controlado (evita javaldx)
+    env = os.environ.copy()
+    env["SAL_USE_VCLPLUGIN"] = "svp"
+    env["JAVA_HOME"] = ""
+    env["JRE_HOME"] = ""
+    return env
+
+
+def run_soffice(args:list, user_profile:Path, timeout:float) -> subprocess.CompletedProcess:
+    # roda o soffice num grupo de processos próprio: no timeout mata também o soffice.bin
+    cmd = [
+        "soffice",
+        f"-env:UserInstallation=file://{user_profile.as_posix()}",
+        "--headless",
+        "--invisible",
+        "--nologo",
+        "--nofirststartwizard",
+        "--norestore",
+        *args,
+    ]
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=soffice_env(), start_new_session=True)
+    try:
+        stdout, stderr = proc.communicate(timeout=max(timeout, 1))
+    except subprocess.TimeoutExpired:
+        os.killpg(proc.pid, signal.SIGKILL)
+        proc.communicate()
+        raise ConversionError(f"timeout ({int(timeout)}s)")
+    return subprocess.CompletedProcess(cmd, proc.returncode, stdout, stderr)
+
+
+def soffice_convert(src_path:Path, out_dir:Path, user_profile:Path, timeout:float) -> Path:
+    # converte com o profile informado; retorna o PDF gerado em out_dir
+    res = run_soffice(["--convert-to", "pdf", "--outdir", str(out_dir), str(src_path)], user_profile, timeout)
+    pdf_path = out_dir / (src_path.stem + ".pdf")
+    if not pdf_path.exists():
+        raise ConversionError((res.stderr or b"").decode("utf-8", "ignore")[:500])
+    return pdf_path
+
+
+class OfficePool(object):
+    # slots do host em directory/slot-N: lock (flock, vale entre processos), profile/ e state.json
+    # com o número de conversões desde a última inicialização do profile
+
+    def __init__(self, directory:str, workers:int, queue_size:int, recycle_after:int):
+        self.directory = Path(directory)
+        self.workers = workers
+        self.queue_size = queue_size
+        self.recycle_after = recycle_after
+        self._waiting = 0
+        self._guard = threading.Lock()
+        for n in range(workers):
+            (self.directory / f"slot-{n}").mkdir(parents=True, exist_ok=True)
+
+    def convert(self, src_path:Path, out_dir:Path, deadline:float) -> Path:
+        # deadline em time.monotonic()
+        with self._guard:
+            if self._waiting >= self.queue_size:
+                raise ConversionBusy("fila de conversão cheia")
+            self._waiting += 1
+        try:
+            slot, fd = self._acquire(deadline)
+        finally:
+            with self._guard:
+                self._waiting -= 1
+        try:
+            return self._run(slot, src_path, out_dir, deadline)
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+    def _acquire(self, deadline:float):
+        first = random.randrange(self.workers)
+        while True:
+            for n in range(self.workers):
+                slot = self.directory / f"slot-{(first + n) % self.workers}"
+                fd = os.open(slot / "lock", os.O_CREAT | os.O_RDWR, 0o600)
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    return slot, fd
+                except BlockingIOError:
+                    os.close(fd)
+            if time.monotonic() >= deadline:
+                raise ConversionBusy("nenhum conversor livre no prazo")
+            time.sleep(0.2)
+
+    def _state(self, slot:Path) -> dict:
+        try:
+            return json.loads((slot / "state.json").read_text())
+        except (OSError, ValueError):
+            return {"conversions": None}
+
+    def _save_state(self, slot:Path, conversions:int) -> None:
+        (slot / "state.json").write_text(json.dumps({"conversions": conversions}))
+
+    def _recycle(self, slot:Path, deadline:float) -> None:
+        # profile novo, já inicializado (o primeiro start é o mais lento)
+        shutil.rmtree(slot / "profile", ignore_errors=True)
+        self._save_state(slot, None)
+        run_soffice(["--terminate_after_init"], slot / "profile", deadline - time.monotonic())
+        self._save_state(slot, 0)
+
+    def _run(self, slot:Path, src_path:Path, out_dir:Path, deadline:float) -> Path:
+        conversions = self._state(slot)["conversions"]
+        if conversions is None or conversions >= self.recycle_after or not (slot / "profile").is_dir():
+            self._recycle(slot, deadline)
+            conversions = 0
+        try:
+            pdf_path = soffice_convert(src_path, out_dir, slot / "profile", deadline - time.monotonic())
+        except BaseException:
+            # travou ou falhou: o profile pode ter ficado inconsistente, recria no próximo uso
+            self._save_state(slot, None)
+            raise
+        self._save_state(slot, conversions + 1)
+        return pdf_path
+
+
+office_pool = OfficePool(PPTPDF_SLOTS_DIR, PPTPDF_WORKERS, PPTPDF_QUEUE_SIZE, PPTPDF_RECYCLE_AFTER)
+
+
+async def ppt_to_pdf_async(wasabi:ctl_wasabi.Wasabi, bucket_dir:str, file_name:str) -> str:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_convert_pool, ppt_to_pdf, wasabi, bucket_dir, file_name)
+
+
+def _fetch_mirror(wasabi:ctl_wasabi.Wasabi, cache_key:str, mirror_key:str) -> str:
+    # PDF já espelhado no bucket por outro servidor -> cache local; None se não há
+    obj = dal_wasabi.get_object(wasabi.s3, bucket_name=wasabi.bucket_root, bucket_dir='', file_name=mirror_key)
+    if not obj:
+        return None
+    try:
+        return _pdf_cache.put_stream(cache_key, obj['Body'])
+    finally:
+        obj['Body'].close()
+
+
+def _download(wasabi:ctl_wasabi.Wasabi, bucket_dir:str, file_name:str, dest:Path) -> bool:
+    # baixa a origem em pedaços direto para o disco
+    obj = wasabi.get_object(bucket_dir, file_name)
+    if not obj:
+        return False
+    try:
+        with open(dest, 'wb') as f:
+            shutil.copyfileobj(obj['Body'], f, 1024 * 1024)
+    finally:
+        obj['Body'].close()
+    return True
+
+
+def ppt_to_pdf(wasabi:ctl_wasabi.Wasabi, bucket_dir:str, file_name:str) -> str:
+    # caminho do PDF no cache local (None se a origem não existe); bloqueante, roda no _convert_pool
+    deadline = time.monotonic() + PPTPDF_DEADLINE
+    head = ctl_wasabi.call_s3(wasabi.head_object, bucket_dir, file_name)
+    if not head:
+        return None
+    key_name = f"{ctl_wasabi.ensure_bucket_dir(wasabi.root, bucket_dir)}{file_name}"
+    cache_key = f"{wasabi.bucket_root}/{key_name}:{head['ETag']}"
+
+    with _key_locks.lock(cache_key):
+        pdf_path = _pdf_cache.get(cache_key)
+        if pdf_path:
+            return pdf_path
+
+        mirror_key = f"{PPTPDF_BUCKET_PREFIX}{os.path.basename(_pdf_cache.path_for(cache_key))}" if PPTPDF_BUCKET_PREFIX else None
+        if mirror_key:
+            pdf_path = ctl_wasabi.call_s3(_fetch_mirror, wasabi, cache_key, mirror_key)
+            if pdf_path:
+                return pdf_path
+
+        tmpdir = tempfile.mkdtemp(prefix="pptpdf_")
+        try:
+            src_path = Path(tmpdir) / file_name
+            if not ctl_wasabi.call_s3(_download, wasabi, bucket_dir, file_name, src_path):
+                return None
+
+            pdf_path = _pdf_cache.put_file(cache_key, str(office_pool.convert(src_path, Path(tmpdir), deadline)))
+        finally:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+    if mirror_key:
+        ctl_wasabi.S3_EXECUTOR.submit(dal_filecache.mirror, wasabi.s3, wasabi.bucket_root, pdf_path, mirror_key)
+    return pdf_path
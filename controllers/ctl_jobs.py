@@ -0,0 +1,150 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from dal import dal_jobs
+from controllers import ctl_wasabi
+
+# operações longas de diretório (mover/renomear, apagar, tamanho) rodam como jobs: a rota só
+# registra o job e responde o id; o progresso fica no sqlite do host, visível a todos os workers.
+# JOB_WORKERS jobs simultâneos por processo, num pool separado do das rotas. Um job sem heartbeat
+# há JOB_STALE_AFTER segundos (worker reciclado/morto) é retomado por outro processo
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_HEARTBEAT = float(os.getenv("JOB_HEARTBEAT", "10"))
+JOB_STALE_AFTER = float(os.getenv("JOB_STALE_AFTER", "60"))
+JOB_MAX_AGE = float(os.getenv("JOB_MAX_AGE", str(7 * 24 * 3600)))
+# intervalo mínimo entre gravações de progresso de um job
+JOB_PROGRESS_INTERVAL = 0.5
+
+_jobs = dal_jobs.JobStore(os.path.join(ctl_wasabi.INDEX_DIR, "jobs.db"))
+_job_pool = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="wasabi-jobs")
+# jobs rodando neste processo (recebem heartbeat do monitor)
+_running = set()
+_running_guard = threading.Lock()
+_monitor_pid = None
+
+
+class JobCancelled(Exception):
+    pass
+
+
+def _move_folder(wasabi:ctl_wasabi.Wasabi, progress, old_path:str, new_path:str) -> tuple:
+    result = wasabi.move_tree(old_path, new_path, progress=progress)
+    return not result['failed'], _summary(result)
+
+
+def _delete_folder(wasabi:ctl_wasabi.Wasabi, progress, path:str) -> tuple:
+    result = wasabi.delete_folder(path, progress=lambda done, total: progress('delete', done, total))
+    return not result['failed'], _summary(result)
+
+
+def _size_folder(wasabi:ctl_wasabi.Wasabi, progress, path:str) -> tuple:
+    progress('list', 0, 0)
+    return True, wasabi.size_folder(path)
+
+
+def _summary(result:dict) -> dict:
+    # contadores + no máximo 100 falhas (o mapa por chave de move_tree pode ser enorme)
+    summary = {k: v for k, v in result.items() if k not in ('failed', 'keys')}
+    summary['failed'] = dict(list(result['failed'].items())[:100])
+    summary['failed_count'] = len(result['failed'])
+    return summary
+
+
+# tipo do job -> função(wasabi, progress, **params) -> (ok, resultado)
+OPERATIONS = {
+    'move_folder': _move_folder,
+    'delete_folder': _delete_folder,
+    'size_folder': _size_folder,
+}
+
+
+def submit(kind:str, owner:str, **params) -> str:
+    # registra o job (ou devolve o igual ainda ativo) e começa neste processo
+    job_id = _jobs.create(kind, owner, params)
+    _start(job_id)
+    return job_id
+
+
+def get(job_id:str, owner:str) -> dict:
+    job = _jobs.get(job_id)
+    return job if job and job['owner'] == owner else None
+
+
+def list_jobs(owner:str, limit:int=20) -> list:
+    return _jobs.list(owner, limit)
+
+
+def cancel(job_id:str, owner:str) -> bool:
+    return get(job_id, owner) is not None and _jobs.cancel(job_id)
+
+
+def resume(job_id:str, owner:str) -> bool:
+    if get(job_id, owner) is None or not _jobs.resume(job_id):
+        return False
+    _start(job_id)
+    return True
+
+
+def _start(job_id:str) -> None:
+    _ensure_monitor()
+    if _jobs.claim(job_id, os.getpid(), time.time() - JOB_STALE_AFTER):
+        with _running_guard:
+            _running.add(job_id)
+        _job_pool.submit(_run, job_id)
+
+
+def _run(job_id:str) -> None:
+    try:
+        job = _jobs.get(job_id)
+        wasabi = ctl_wasabi.Wasabi(job['owner'])
+        last = [0.0]
+
+        def progress(stage:str, done:int, total:int) -> None:
+            now = time.monotonic()
+            if now - last[0] < JOB_PROGRESS_INTERVAL and done < total:
+                return
+            last[0] = now
+            if _jobs.progress(job_id, stage, done, total):
+                raise JobCancelled()
+
+        try:
+            if job['cancel']:
+                raise JobCancelled()
+            ok, result = OPERATIONS[job['kind']](wasabi, progress, **job['params'])
+            _jobs.finish(job_id, dal_jobs.DONE if ok else dal_jobs.FAILED, result)
+        except JobCancelled:
+            _jobs.finish(job_id, dal_jobs.CANCELLED)
+        except Exception as e:
+            _jobs.finish(job_id, dal_jobs.FAILED, error=str(e))
+    finally:
+        with _running_guard:
+            _running.discard(job_id)
+
+
+def _ensure_monitor() -> None:
+    # uma thread por processo (os workers do uwsgi são forks: não herdam a do pai)
+    global _monitor_pid
+    with _running_guard:
+        if _monitor_pid == os.getpid():
+            return
+        _monitor_pid = os.getpid()
+        _running.clear()
+    threading.Thread(target=_monitor, name="wasabi-jobs-monitor", daemon=True).start()
+
+
+def _monitor() -> None:
+    # heartbeat dos jobs deste processo e retomada dos que ficaram órfãos em qualquer worker
+    while True:
+        time.sleep(JOB_HEARTBEAT)
+        try:
+            with _running_guard:
+                running = list(_running)
+            _jobs.heartbeat(running, os.getpid())
+            if len(running) < JOB_WORKERS:
+                for job_id in _jobs.stale(time.time() - JOB_STALE_AFTER)[:JOB_WORKERS - len(running)]:
+                    _start(job_id)
+            _jobs.prune(JOB_MAX_AGE)
+        except Exception as e:
+            print(f"Error: {e}")
@@ -0,0 +1,164 @@
+import asyncio
+import functools
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+
+from dal import dal_wasabi
+from dal import dal_filecache
+from dal import dal_image
+from controllers import ctl_wasabi
+
+# miniaturas/previews de imagens: lado máximo fixo (THUMB_SIZES), WebP quando o browser aceita
+# (senão JPEG), em cache por (objeto, ETag, tamanho, formato)
+THUMB_SIZES = tuple(sorted(int(s) for s in os.getenv("THUMB_SIZES", "256,1024").split(",")))
+THUMB_EXTENSIONS = {"jpg", "jpeg", "png", "gif", "webp", "bmp", "tif", "tiff"}
+THUMB_MAX_SOURCE_BYTES = int(os.getenv("THUMB_MAX_SOURCE_BYTES", str(100 * 1024 * 1024)))
+THUMB_CACHE_DIR = os.getenv("THUMB_CACHE_DIR", os.path.join(ctl_wasabi.INDEX_DIR, "thumbs"))
+THUMB_CACHE_MAX_BYTES = int(os.getenv("THUMB_CACHE_MAX_BYTES", str(1024 * 1024 * 1024)))
+# prefixo (fora dos roots dos tenants) onde as miniaturas são espelhadas no bucket; vazio = só local
+THUMB_BUCKET_PREFIX = os.getenv("THUMB_BUCKET_PREFIX", "")
+# decodificar/redimensionar é CPU: vai para processos, fora do GIL dos workers
+THUMB_WORKERS = int(os.getenv("THUMB_WORKERS", "2"))
+THUMB_TIMEOUT = float(os.getenv("THUMB_TIMEOUT", "60"))
+
+_thumb_cache = dal_filecache.DiskCache(THUMB_CACHE_DIR, THUMB_CACHE_MAX_BYTES)
+# geração em segundo plano depois dos uploads
+_warm_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="thumb-warm")
+
+_render_pool = None
+_render_pool_pid = None
+_render_guard = threading.Lock()
+
+_key_locks = dal_filecache.KeyLocks()
+
+
+def render_pool() -> ProcessPoolExecutor:
+    # criado no primeiro uso de cada processo (os workers do uwsgi são forks); spawn para não
+    # herdar threads/conexões do worker
+    global _render_pool, _render_pool_pid
+    with _render_guard:
+        if _render_pool is None or _render_pool_pid != os.getpid():
+            _render_pool = ProcessPoolExecutor(max_workers=THUMB_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+            _render_pool_pid = os.getpid()
+        return _render_pool
+
+
+def supported(file_name:str) -> bool:
+    return dal_image.available() and Path(file_name).suffix[1:].lower() in THUMB_EXTENSIONS
+
+
+def thumb_size(requested:int) -> int:
+    # menor tamanho configurado que atende o pedido
+    return next((s for s in THUMB_SIZES if s >= requested), THUMB_SIZES[-1])
+
+
+def thumb_format(accept:str) -> str:
+    return 'webp' if dal_image.webp_available() and 'image/webp' in (accept or '') else 'jpeg'
+
+
+def _keys(wasabi:ctl_wasabi.Wasabi, bucket_dir:str, file_name:str, head:dict, sizes:list, fmt:str) -> tuple:
+    # (chave base, {tamanho: chave no cache local}, {tamanho: chave do espelho no bucket})
+    key_name = f"{ctl_wasabi.ensure_bucket_dir(wasabi.root, bucket_dir)}{file_name}"
+    base_key = f"{wasabi.bucket_root}/{key_name}:{head['ETag']}"
+    cache_keys = {size: f"{base_key}:{size}.{fmt}" for size in sizes}
+    mirror_keys = {size: f"{THUMB_BUCKET_PREFIX}{os.path.basename(_thumb_cache.path_for(k))}" for size, k in cache_keys.items()} if THUMB_BUCKET_PREFIX else {}
+    return base_key, cache_keys, mirror_keys
+
+
+def _prepare(wasabi:ctl_wasabi.Wasabi, bucket_dir:str, file_name:str, head:dict, cache_keys:dict, mirror_keys:dict) -> tuple:
+    # S3: (encontradas, tmpdir, origem) com o que já existe (cache local ou espelho) e, se faltar
+    # alguma rendição, a origem baixada em tmpdir (None quando não há o que renderizar)
+    found = {size: _thumb_cache.get(k) for size, k in cache_keys.items()}
+    for size in [s for s, path in found.items() if not path and s in mirror_keys]:
+        obj = dal_wasabi.get_object(wasabi.s3, bucket_name=wasabi.bucket_root, bucket_dir='', file_name=mirror_keys[size])
+        if obj:
+            try:
+                found[size] = _thumb_cache.put_stream(cache_keys[size], obj['Body'])
+            finally:
+                obj['Body'].close()
+    if all(found.values()) or head['ContentLength'] > THUMB_MAX_SOURCE_BYTES:
+        return found, None, None
+
+    tmpdir = tempfile.mkdtemp(prefix="thumb_")
+    try:
+        src_path = os.path.join(tmpdir, "source")
+        obj = wasabi.get_object(bucket_dir, file_name)
+        if not obj:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+            return found, None, None
+        try:
+            with open(src_path, 'wb') as f:
+                shutil.copyfileobj(obj['Body'], f, 1024 * 1024)
+        finally:
+            obj['Body'].close()
+    except BaseException:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+        raise
+    return found, tmpdir, src_path
+
+
+def _outputs(found:dict, fmt:str, tmpdir:str) -> list:
+    return [(size, fmt, os.path.join(tmpdir, f"{size}.{fmt}")) for size, path in found.items() if not path]
+
+
+def _store(wasabi:ctl_wasabi.Wasabi, found:dict, outputs:list, cache_keys:dict, mirror_keys:dict) -> dict:
+    # rendições geradas -> cache local (e espelho no bucket, em segundo plano)
+    for size, fmt_, dest in outputs:
+        found[size] = _thumb_cache.put_file(cache_keys[size], dest)
+        if size in mirror_keys:
+            ctl_wasabi.S3_EXECUTOR.submit(dal_filecache.mirror, wasabi.s3, wasabi.bucket_root, found[size], mirror_keys[size])
+    return found
+
+
+def renditions(wasabi:ctl_wasabi.Wasabi, bucket_dir:str, file_name:str, head:dict, sizes:list, fmt:str) -> dict:
+    # {tamanho: caminho no cache local}; baixa e decodifica a origem uma vez para todos os que
+    # faltarem. Bloqueante (warm); as rotas usam thumbnail
+    base_key, cache_keys, mirror_keys = _keys(wasabi, bucket_dir, file_name, head, sizes, fmt)
+    with _key_locks.lock(base_key):
+        found, tmpdir, src_path = _prepare(wasabi, bucket_dir, file_name, head, cache_keys, mirror_keys)
+        if tmpdir is None:
+            return found
+        try:
+            outputs = _outputs(found, fmt, tmpdir)
+            render_pool().submit(dal_image.render, src_path, outputs).result(timeout=THUMB_TIMEOUT)
+            return _store(wasabi, found, outputs, cache_keys, mirror_keys)
+        finally:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+async def thumbnail(wasabi:ctl_wasabi.Wasabi, bucket_dir:str, file_name:str, head:dict, size:int, fmt:str) -> str:
+    # o S3 vai para o S3_EXECUTOR e a espera pelo processo de render fica no event loop
+    base_key, cache_keys, mirror_keys = _keys(wasabi, bucket_dir, file_name, head, [size], fmt)
+    async with _key_locks.alock(base_key):
+        found, tmpdir, src_path = await ctl_wasabi.run_s3(_prepare, wasabi, bucket_dir, file_name, head, cache_keys, mirror_keys)
+        if tmpdir is None:
+            return found.get(size)
+        loop = asyncio.get_running_loop()
+        try:
+            outputs = _outputs(found, fmt, tmpdir)
+            await asyncio.wait_for(asyncio.wrap_future(render_pool().submit(dal_image.render, src_path, outputs)), THUMB_TIMEOUT)
+            # mover para o cache (e a limpeza do LRU) é disco: fora do event loop
+            found = await loop.run_in_executor(None, _store, wasabi, found, outputs, cache_keys, mirror_keys)
+        finally:
+            await loop.run_in_executor(None, functools.partial(shutil.rmtree, tmpdir, ignore_errors=True))
+    return found.get(size)
+
+
+def warm(wasabi:ctl_wasabi.Wasabi, bucket_dir:str, file_name:str) -> None:
+    # gera todas as rendições em segundo plano (ex. logo após o upload)
+    if supported(file_name):
+        _warm_pool.submit(_warm, wasabi, bucket_dir, file_name)
+
+
+def _warm(wasabi:ctl_wasabi.Wasabi, bucket_dir:str, file_name:str) -> None:
+    try:
+        head = wasabi.head_object(bucket_dir, file_name)
+        if head:
+            renditions(wasabi, bucket_dir, file_name, head, list(THUMB_SIZES), 'webp' if dal_image.webp_available() else 'jpeg')
+    except Exception as e:
+        print(f"Error: {e}")
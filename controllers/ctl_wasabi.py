@@ -1,8 +1,24 @@
+import asyncio
+import fcntl
+import functools
+import io
+import itertools
 import json
 import os
+import random
+import tempfile
+import threading
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
 from pathlib import Path
 
 from dal import dal_wasabi
+from dal import dal_cache
+from dal import dal_index
+from dal import dal_entry
 import config
 
 def ensure_folder_ends(folder_name:str) -> str: 
@@ -15,15 +31,392 @@ def ensure_folder_ends(folder_name:str) -> str:
 def ensure_bucket_dir(parent_dir:str, folder_name:str) -> str:
     return f"{ensure_folder_ends(parent_dir)}{ensure_folder_ends(folder_name)}" if folder_name and folder_name != "/" else ensure_folder_ends(parent_dir)
 
+def listing_prefix(root:str, folder_name:str) -> str:
+    # mesmo Prefix montado por dal_wasabi.list_folder_contents
+    folder_name = ensure_folder_ends(folder_name)
+    return f"{root}/{folder_name}" if folder_name != '/' else f"{root}/"
+
+# índices e caches locais ficam em INDEX_DIR (sqlite compartilhado pelos workers do host)
+INDEX_DIR = os.getenv("LMDRIVE_INDEX_DIR", os.path.join(tempfile.gettempdir(), "lmdrive"))
+
+# cache do host para listagens, tags e HEAD: um round trip ao S3 serve todos os workers, e
+# as mutações abaixo gravam eventos de invalidação que cada worker aplica ao seu cache em memória
+SHARED_CACHE = os.getenv("SHARED_CACHE", "1") == "1"
+_shared_cache = dal_cache.SharedCache(os.path.join(INDEX_DIR, "shared_cache.db")) if SHARED_CACHE else None
+if _shared_cache:
+    dal_wasabi.share_tag_cache(_shared_cache)
+
+# cache das listagens: (prefixo, root do tenant) -> lista já com tags
+LISTING_CACHE_TTL = float(os.getenv("LISTING_CACHE_TTL", "60"))
+LISTING_CACHE_SIZE = int(os.getenv("LISTING_CACHE_SIZE", "512"))
+_listing_cache = dal_cache.TieredCache(_shared_cache, 'listing', LISTING_CACHE_SIZE, ttl=LISTING_CACHE_TTL)
+
+# HEAD dos objetos: (chave, bucket) -> resposta; curto, pois só as escritas feitas por aqui invalidam
+HEAD_CACHE_TTL = float(os.getenv("HEAD_CACHE_TTL", "30"))
+HEAD_CACHE_SIZE = int(os.getenv("HEAD_CACHE_SIZE", "4096"))
+_head_cache = dal_cache.TieredCache(_shared_cache, 'head', HEAD_CACHE_SIZE, ttl=HEAD_CACHE_TTL)
+
+def invalidate_listing(key_name:str, recursive:bool=False) -> None:
+    # uma chave aparece na listagem de cada diretório ancestral (e na própria, se for diretório);
+    # compara só o prefixo pois roots diferentes (ex. .../Área_do_Cliente) enxergam as mesmas chaves
+    _listing_cache.invalidate({key_name[:i+1] for i, c in enumerate(key_name) if c == '/'})
+    if recursive:
+        _listing_cache.invalidate([ensure_folder_ends(key_name)], recursive=True)
+
+def invalidate_head(key_name:str, recursive:bool=False) -> None:
+    _head_cache.invalidate([key_name], recursive=recursive)
+
+# índice local de tamanhos por diretório
+SIZE_INDEX_MAX_AGE = float(os.getenv("SIZE_INDEX_MAX_AGE", str(24 * 3600)))
+_size_index = dal_index.SizeIndex(os.path.join(INDEX_DIR, "size_index.db"), max_age=SIZE_INDEX_MAX_AGE)
+
+# índice local de nomes (trigramas) para a busca; mesma normalização nos nomes e nas consultas
+NAME_INDEX_MAX_AGE = float(os.getenv("NAME_INDEX_MAX_AGE", str(24 * 3600)))
+FIND_PAGE_SIZE = int(os.getenv("FIND_PAGE_SIZE", "100"))
+
+def normalize_name(name:str) -> str:
+    return dal_wasabi.remove_accents(name).casefold()
+
+_name_index = dal_index.NameIndex(os.path.join(INDEX_DIR, "name_index.db"), max_age=NAME_INDEX_MAX_AGE, normalize=normalize_name)
+
+# catálogo local do bucket (chave, tamanho, data, ETag, dono): uma varredura completa monta o
+# espelho, as escritas abaixo o mantêm (write-through) e um worker do host por vez reconcilia
+# com o S3 a cada CATALOG_RECONCILE_INTERVAL segundos, CATALOG_RECONCILE_PAGES páginas
+# (StartAfter) por rodada. Com CATALOG=1 as listagens saem dele; o S3 fica para o que não cobre
+CATALOG = os.getenv("CATALOG", "1") == "1"
+CATALOG_MAX_AGE = float(os.getenv("CATALOG_MAX_AGE", str(7 * 24 * 3600)))
+CATALOG_RECONCILE_INTERVAL = float(os.getenv("CATALOG_RECONCILE_INTERVAL", "300"))
+CATALOG_RECONCILE_PAGES = int(os.getenv("CATALOG_RECONCILE_PAGES", "20"))
+# espera antes da primeira reconciliação (mais até o mesmo tanto de jitter), para um worker que
+# acabou de subir (ou foi reciclado) não começar varrendo o bucket
+CATALOG_START_DELAY = float(os.getenv("CATALOG_START_DELAY", "60"))
+_catalog = dal_index.Catalog(os.path.join(INDEX_DIR, "catalog.db"), max_age=CATALOG_MAX_AGE)
+# atualização das chaves/prefixos em estado desconhecido, fora da requisição
+_catalog_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="wasabi-catalog")
+_catalog_sync_pid = None
+_catalog_sync_guard = threading.Lock()
+
+# avisos de escrita: todo método de Wasabi que altera o bucket passa por aqui
+def object_written(key_name:str, size:int=None, user:str=None) -> None:
+    invalidate_listing(key_name)
+    invalidate_head(key_name)
+    _size_index.add_object(key_name, size)
+    _name_index.add_object(key_name, size, user)
+    if size is None:
+        catalog_changed(key_name)
+    else:
+        _catalog.put_objects([(key_name, size, time.time(), None, user)])
+
+def object_removed(key_name:str) -> None:
+    invalidate_listing(key_name)
+    invalidate_head(key_name)
+    _size_index.remove_object(key_name)
+    _name_index.remove_object(key_name)
+    _catalog.remove_object(key_name)
+
+def object_moved(old_key:str, new_key:str) -> None:
+    invalidate_listing(old_key)
+    invalidate_listing(new_key)
+    invalidate_head(old_key)
+    invalidate_head(new_key)
+    size = _size_index.object_size(old_key)
+    _size_index.remove_object(old_key)
+    _size_index.add_object(new_key, size)
+    _name_index.move(old_key, new_key)
+    _catalog.move(old_key, new_key)
+
+def tree_moved(old_prefix:str, new_prefix:str, objects:list) -> None:
+    # objects: [(key, size)] gravados sob o novo prefixo
+    invalidate_listing(old_prefix, recursive=True)
+    invalidate_listing(new_prefix, recursive=True)
+    invalidate_head(old_prefix, recursive=True)
+    invalidate_head(new_prefix, recursive=True)
+    _size_index.remove_prefix(old_prefix)
+    _size_index.add_objects(objects)
+    _name_index.move(old_prefix, new_prefix)
+    _catalog.move(old_prefix, new_prefix)
+
+def tree_removed(prefix:str) -> None:
+    invalidate_listing(prefix, recursive=True)
+    invalidate_head(prefix, recursive=True)
+    _size_index.remove_prefix(prefix)
+    _name_index.remove_prefix(prefix)
+    _catalog.remove_prefix(prefix)
+
+def tree_changed(prefix:str) -> None:
+    # resultado parcial/desconhecido: descarta o que estiver em cache para o prefixo
+    invalidate_listing(prefix, recursive=True)
+    invalidate_head(prefix, recursive=True)
+    _size_index.invalidate(prefix)
+    _name_index.invalidate(prefix)
+    catalog_changed(prefix)
+
+def catalog_changed(key_name:str) -> None:
+    # estado desconhecido no catálogo: as listagens afetadas vão ao S3 até o refresh
+    _catalog.invalidate(key_name)
+    _catalog_pool.submit(refresh_catalog, key_name)
+
+def catalog_entries(prefix:str):
+    # (key, size, modified, etag, user) de toda a árvore do prefixo direto do S3, tags em lotes
+    objects = dal_wasabi.list_partitioned(S3, bucket_name=Wasabi.bucket_root, prefix=prefix)
+    while True:
+        batch = list(itertools.islice(objects, 1000))
+        if not batch:
+            return
+        users = dal_wasabi.get_tag_bulk(S3, bucket_name=Wasabi.bucket_root, objects=[(obj['Key'], obj.get('ETag')) for obj in batch if not obj['Key'].endswith('/')], tag_key_to_query='username')
+        for obj in batch:
+            yield obj['Key'], obj['Size'], obj['LastModified'].timestamp(), obj.get('ETag'), users.get(obj['Key'], '')
+
+def tree_entries(prefix:str):
+    # mesma coisa, do catálogo quando ele cobre o prefixo
+    objects = _catalog.objects(prefix) if CATALOG else None
+    return objects if objects is not None else catalog_entries(prefix)
+
+def refresh_catalog(key_name:str) -> None:
+    try:
+        if not key_name or key_name.endswith('/'):
+            _catalog.build(key_name, catalog_entries(key_name))
+            return
+        started = time.time()
+        since = _catalog.mark()
+        head = dal_wasabi.head_object(S3, bucket_name=Wasabi.bucket_root, bucket_dir='', file_name=key_name)
+        if head:
+            user = dal_wasabi.get_tag(S3, bucket_name=Wasabi.bucket_root, file_path=key_name, tag_key_to_query='username')
+            _catalog.apply([(key_name, head['ContentLength'], head['LastModified'].timestamp(), head.get('ETag'), user)], [], since)
+        else:
+            _catalog.apply([], [key_name], since)
+        _catalog.clear_stale(key_name, started)
+    except Exception as e:
+        # fica como stale; a reconciliação tenta de novo
+        print(f"Error: {e}")
+
+def reconcile_catalog(pages:int=CATALOG_RECONCILE_PAGES) -> None:
+    # refaz o que estiver stale, monta o catálogo se ainda não existe e avança a varredura
+    # incremental (StartAfter) do bucket; ao chegar no fim recomeça e renova a cobertura
+    for key_name in _catalog.stale():
+        refresh_catalog(key_name)
+    if not _catalog.covered(''):
+        _catalog.build('', catalog_entries(''))
+        return
+    cursor = _catalog.state('reconcile_after', '')
+    for _ in range(pages):
+        since = _catalog.mark()
+        resp = dal_wasabi.list_page_after(S3, bucket_name=Wasabi.bucket_root, start_after=cursor)
+        contents = resp.get('Contents', [])
+        last_key = contents[-1]['Key'] if resp.get('IsTruncated') and contents else None
+        removed, changed = _catalog.diff(cursor, last_key, [(obj['Key'], obj['Size'], obj.get('ETag')) for obj in contents])
+        if removed or changed:
+            modified = {obj['Key']: obj['LastModified'].timestamp() for obj in contents}
+            users = dal_wasabi.get_tag_bulk(S3, bucket_name=Wasabi.bucket_root, objects=[(key, etag) for key, size, etag in changed if not key.endswith('/')], tag_key_to_query='username')
+            _catalog.apply([(key, size, modified[key], etag, users.get(key, '')) for key, size, etag in changed], removed, since)
+        cursor = last_key or ''
+        _catalog.set_state('reconcile_after', cursor)
+        if last_key is None:
+            _catalog.touch('')
+            _catalog.prune_log(CATALOG_MAX_AGE)
+            return
+
+def _catalog_sync() -> None:
+    # só um worker do host reconcilia: quem pegar o lock fica com a tarefa enquanto viver
+    fd = os.open(os.path.join(INDEX_DIR, "catalog.lock"), os.O_CREAT | os.O_RDWR, 0o600)
+    while True:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            break
+        except BlockingIOError:
+            time.sleep(CATALOG_RECONCILE_INTERVAL)
+    time.sleep(CATALOG_START_DELAY * (1 + random.random()))
+    while True:
+        try:
+            reconcile_catalog()
+        except Exception as e:
+            print(f"Error: {e}")
+        time.sleep(CATALOG_RECONCILE_INTERVAL)
+
+def start_catalog_sync() -> None:
+    # chamado no startup da aplicação (não por Wasabi(), que scripts e jobs também criam);
+    # uma thread por processo (os workers do uwsgi são forks: não herdam a do pai)
+    global _catalog_sync_pid
+    if not CATALOG:
+        return
+    with _catalog_sync_guard:
+        if _catalog_sync_pid != os.getpid():
+            _catalog_sync_pid = os.getpid()
+            threading.Thread(target=_catalog_sync, name="wasabi-catalog-sync", daemon=True).start()
+
+# pool dedicado para as chamadas bloqueantes de boto3 (S3/IAM) feitas pelas rotas async
+S3_WORKERS = int(os.getenv("S3_WORKERS", "32"))
+S3_EXECUTOR = ThreadPoolExecutor(max_workers=S3_WORKERS, thread_name_prefix="wasabi-s3")
+
+async def run_s3(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(S3_EXECUTOR, functools.partial(func, *args, **kwargs))
+
+def call_s3(func, *args, **kwargs):
+    # o mesmo, para código que já roda numa thread de outro pool (ex. conversões): só a chamada
+    # ao S3 ocupa o S3_EXECUTOR. Não chamar de dentro do próprio S3_EXECUTOR
+    return S3_EXECUTOR.submit(func, *args, **kwargs).result()
+
+# download de objetos: o corpo é lido em blocos de STREAM_CHUNK_SIZE no _stream_pool, no máximo
+# STREAM_BUFFERS blocos à frente do cliente. Cliente lento = leitura parada (backpressure), sem
+# thread presa esperando por ele; memória por download limitada a STREAM_BUFFERS + 1 blocos
+STREAM_CHUNK_SIZE = int(os.getenv("STREAM_CHUNK_SIZE", str(1024 * 1024)))
+STREAM_BUFFERS = int(os.getenv("STREAM_BUFFERS", "2"))
+STREAM_WORKERS = int(os.getenv("STREAM_WORKERS", "32"))
+# estatísticas dos últimos STREAM_STATS downloads terminados, por processo
+STREAM_STATS = int(os.getenv("STREAM_STATS", "200"))
+
+_stream_pool = ThreadPoolExecutor(max_workers=STREAM_WORKERS, thread_name_prefix="wasabi-stream")
+_stream_ids = itertools.count(1)
+_streams_active = dict()
+_streams_done = deque(maxlen=STREAM_STATS)
+
+
+class BodyStream(object):
+    # iterável async sobre o StreamingBody do boto (para o StreamingResponse). Tempos por stream:
+    # read = lendo do Wasabi, stall = cliente esperando dados (gargalo no Wasabi),
+    # send = bloco pronto esperando o cliente (gargalo no cliente)
+
+    def __init__(self, body, name:str='', owner:str='', chunk_size:int=STREAM_CHUNK_SIZE, buffers:int=STREAM_BUFFERS):
+        self.body = body
+        self.chunk_size = chunk_size
+        self.buffers = max(buffers, 1)
+        self.stats = {'id': next(_stream_ids), 'name': name, 'owner': owner, 'bytes': 0, 'chunks': 0, 'started_at': time.time(),
+                      'seconds': 0.0, 'read': 0.0, 'stall': 0.0, 'send': 0.0, 'mbps': 0.0, 'error': None}
+
+    async def __aiter__(self):
+        loop = asyncio.get_running_loop()
+        ready = deque()
+        wake = asyncio.Event()
+        state = {'reading': False, 'eof': False, 'closed': False, 'error': None}
+        stats = self.stats
+
+        def read() -> tuple:
+            t = time.monotonic()
+            data = self.body.read(self.chunk_size)
+            return data, time.monotonic() - t
+
+        def start() -> None:
+            # leituras em sequência (o corpo não aceita leituras simultâneas), uma de cada vez
+            if state['reading'] or state['eof'] or state['closed'] or state['error'] is not None or len(ready) >= self.buffers:
+                return
+            state['reading'] = True
+            loop.run_in_executor(_stream_pool, read).add_done_callback(done)
+
+        def done(future) -> None:
+            # roda no event loop
+            state['reading'] = False
+            if state['closed']:
+                # o cliente já foi embora: fecha só agora, sem disputar a leitura em curso
+                future.exception()
+                self.body.close()
+                return
+            try:
+                data, elapsed = future.result()
+            except Exception as e:
+                state['error'] = e
+            else:
+                stats['read'] += elapsed
+                if data:
+                    ready.append(data)
+                else:
+                    state['eof'] = True
+            wake.set()
+            start()
+
+        started = time.monotonic()
+        _streams_active[stats['id']] = stats
+        try:
+            start()
+            while True:
+                if not ready:
+                    if state['error'] is not None:
+                        raise state['error']
+                    if state['eof']:
+                        break
+                    wake.clear()
+                    t = time.monotonic()
+                    await wake.wait()
+                    stats['stall'] += time.monotonic() - t
+                    continue
+                data = ready.popleft()
+                start()
+                t = time.monotonic()
+                yield data
+                stats['send'] += time.monotonic() - t
+                stats['bytes'] += len(data)
+                stats['chunks'] += 1
+        except BaseException as e:
+            stats['error'] = type(e).__name__ if not str(e) else str(e)
+            raise
+        finally:
+            state['closed'] = True
+            if not state['reading']:
+                self.body.close()
+            stats['seconds'] = time.monotonic() - started
+            stats['mbps'] = stats['bytes'] / stats['seconds'] / 1e6 if stats['seconds'] else 0.0
+            _streams_active.pop(stats['id'], None)
+            _streams_done.append(stats)
+
+
+def stream_stats(owner:str=None) -> dict:
+    # downloads em andamento e os últimos terminados neste processo (de owner, se informado)
+    def view(stats:dict) -> dict:
+        stats = dict(stats)
+        if stats['id'] in _streams_active:
+            stats['seconds'] = time.time() - stats['started_at']
+            stats['mbps'] = stats['bytes'] / stats['seconds'] / 1e6 if stats['seconds'] else 0.0
+        return stats
+    active = [view(s) for s in list(_streams_active.values()) if owner is None or s['owner'] == owner]
+    done = [view(s) for s in list(_streams_done) if owner is None or s['owner'] == owner]
+    return {'pid': os.getpid(), 'active': active, 'done': done[::-1]}
+
+# download de diretório em zip (streaming): lê os próximos arquivos em paralelo enquanto
+# o atual é escrito; memória limitada a ZIP_READAHEAD_FILES * ZIP_READAHEAD_BYTES
+ZIP_READAHEAD_FILES = int(os.getenv("ZIP_READAHEAD_FILES", "4"))
+ZIP_READAHEAD_BYTES = int(os.getenv("ZIP_READAHEAD_BYTES", str(4 * 1024 * 1024)))
+ZIP_CHUNK_SIZE = int(os.getenv("ZIP_CHUNK_SIZE", str(1024 * 1024)))
+ZIP_WORKERS = int(os.getenv("ZIP_WORKERS", "16"))
+# já comprimidos: vão "stored", sem gastar CPU com deflate
+ZIP_STORED_EXTENSIONS = {
+    "jpg", "jpeg", "png", "gif", "webp", "heic", "raw",
+    "mp4", "webm", "mov", "mkv", "flv", "avi",
+    "mp3", "aac", "ogg", "m4a", "flac", "amr",
+    "zip", "rar", "7z", "gz", "bz2", "xz",
+    "pdf", "docx", "xlsx", "pptx", "odt", "ods", "odp",
+}
+
+_zip_pool = ThreadPoolExecutor(max_workers=ZIP_WORKERS, thread_name_prefix="wasabi-zip")
+
+
+class ZipStream(io.RawIOBase):
+    # destino não-seekable do ZipFile: acumula o que foi escrito até o gerador consumir
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._buffer += data
+        return len(data)
+
+    def pop(self) -> bytes:
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return data
+
 IAM = dal_wasabi.create_client('iam',
                 endpoint_url = 'https://iam.wasabisys.com',
                 access_key_id = config.aws_access_key_id,
                 secret_access_key = config.aws_secret_access_key)
 
+# o mesmo cliente atende as rotas (S3_EXECUTOR), os downloads (_stream_pool) e os pools do dal
 S3 = dal_wasabi.create_client('s3',
                 endpoint_url = 'https://s3.wasabisys.com',
                 access_key_id = config.aws_access_key_id,
-                secret_access_key = config.aws_secret_access_key)
+                secret_access_key = config.aws_secret_access_key,
+                max_pool_connections = max(dal_wasabi.MAX_POOL_CONNECTIONS, S3_WORKERS + STREAM_WORKERS))
 
 diretorios_sistema = ['Materiais_do_Cliente/',
                       'Materiais_do_Cliente/Fotos/',
@@ -50,6 +443,7 @@ class Wasabi(object):
             dirlist = dal_wasabi.list_folder_contents(self.s3, bucket_name=self.bucket_root, root=self.root)
             if not dirlist:
                 dal_wasabi.put_object(self.s3, bucket_name=self.bucket_root, key_name=self.root_dir)
+                object_written(self.root_dir, 0)
                 if not self.root.startswith('fileshare-'):
                     if '/Materiais_do_Cliente/' not in self.root_dir:
                         self.create_folder('Materiais_do_Cliente/')
@@ -62,83 +456,188 @@ class Wasabi(object):
                         self.create_folder('Área_do_Cliente/')
                     
     def list_folder(self, folder_name:str) -> list:
-        lista = dal_wasabi.list_folder_contents(self.s3, bucket_name=self.bucket_root, root=self.root, folder_name=ensure_folder_ends(folder_name))
-        for l in lista:
-            l['user'] = dal_wasabi.get_tag(self.s3, bucket_name=self.bucket_root, file_path=l['obj'], tag_key_to_query='username') if not l['isdir'] else ''
-            l['obj'] = l['obj'].replace(ensure_folder_ends(self.root),'')
-            l['system'] = l['obj'] in diretorios_sistema
-        return lista
+        prefix = listing_prefix(self.root, folder_name)
+        lista = _listing_cache.get(prefix, self.root)
+        if lista is None:
+            token = _listing_cache.token()
+            children = _catalog.children(prefix) if CATALOG else None
+            if children is not None:
+                # consulta indexada no catálogo local, já com o dono de cada arquivo
+                dirs, files, exists = children
+                lista = dal_wasabi.folder_entries(self.root, prefix, [(key, size, datetime.fromtimestamp(modified, timezone.utc), etag, user) for key, size, modified, etag, user in files], dirs, exists)
+            else:
+                lista = dal_wasabi.list_folder_contents(self.s3, bucket_name=self.bucket_root, root=self.root, folder_name=ensure_folder_ends(folder_name))
+                users = dal_wasabi.get_tag_bulk(self.s3, bucket_name=self.bucket_root, objects=[(l.obj, l.etag) for l in lista if not l.isdir], tag_key_to_query='username')
+                for l in lista:
+                    l.user = users.get(l.obj, '') if not l.isdir else ''
+            for l in lista:
+                l.obj = l.obj.replace(ensure_folder_ends(self.root),'')
+                l.system = l.obj in diretorios_sistema
+            _listing_cache.set(prefix, self.root, lista, token=token)
+        # as entradas são compartilhadas com o cache e não devem ser alteradas por quem chama
+        return list(lista)
     
+    def listing_view(self, folder_name:str, view, build):
+        # dado derivado da listagem (ex. entradas ordenadas + chaves de ordenação), calculado uma
+        # vez por processo por build(list_folder(...)) e invalidado junto com ela
+        prefix = listing_prefix(self.root, folder_name)
+        value = _listing_cache.get(prefix, (self.root, view), shared=False)
+        if value is None:
+            token = _listing_cache.token()
+            value = build(self.list_folder(folder_name))
+            _listing_cache.set(prefix, (self.root, view), value, token=token, shared=False)
+        return value
+
     def create_folder(self, subfolder_path:str):
         # Create an empty object with the subfolder key
         if subfolder_path:
             dal_wasabi.put_object(self.s3, bucket_name=self.bucket_root, key_name=ensure_bucket_dir(self.root, subfolder_path))
+            object_written(ensure_bucket_dir(self.root, subfolder_path), 0)
        
-    def delete_folder(self, subfolder_path:str):
-        deletados = []
-        if subfolder_path not in diretorios_sistema:
-            dir_content = self.list_folder(subfolder_path)
-            files_to_delete = [{'Key': f"{self.root}/{obj['obj']}"} for obj in dir_content if not obj.get('isdir',False)]
-            r = dal_wasabi.delete_objects(self.s3, bucket_name=self.bucket_root, del_objects=files_to_delete)
-            if r:
-                deletados.extend(r['Deleted'])
-            folders_to_delete = [{'Key': obj['obj']} for obj in dir_content if obj.get('isdir',False) and obj['obj'].startswith(subfolder_path) and obj['obj'] != subfolder_path]
-            for f in folders_to_delete:
-                deletados.append(self.delete_folder(f['Key']))
-            dal_wasabi.delete_object(self.s3, bucket_name=self.bucket_root, key_name=ensure_bucket_dir(self.root, subfolder_path))
-        return deletados
-    
+    def delete_folder(self, subfolder_path:str, progress=None) -> dict:
+        # lista o prefixo inteiro uma vez (sem tags) e apaga em lotes de 1000 em paralelo
+        # progress(feitos, total); retorna só o resumo
+        result = {'total': 0, 'deleted': 0, 'failed': dict()}
+        subfolder_path = ensure_folder_ends(subfolder_path)
+        # diretórios de sistema (e os que os contêm, como a raiz) não são apagados
+        if not subfolder_path or subfolder_path == '/' or any(d.startswith(subfolder_path) for d in diretorios_sistema):
+            return result
+        prefix = ensure_bucket_dir(self.root, subfolder_path)
+        keys = [obj['Key'] for obj in dal_wasabi.list_partitioned(self.s3, bucket_name=self.bucket_root, prefix=prefix)]
+        if prefix not in keys:
+            keys.append(prefix)
+        result['total'] = len(keys)
+        try:
+            deletes = dal_wasabi.delete_keys(self.s3, bucket_name=self.bucket_root, keys=keys, progress=progress)
+        except BaseException:
+            tree_changed(prefix)
+            raise
+        result['deleted'] = sum(1 for error in deletes.values() if error is None)
+        result['failed'] = {k: error for k, error in deletes.items() if error}
+        if result['failed']:
+            tree_changed(prefix)
+        else:
+            tree_removed(prefix)
+        return result
+
+    def zip_folder(self, subfolder_path:str, recursive:bool=True):
+        # gerador de bytes de um zip (zip64) do diretório, sem arquivo temporário
+        prefix = ensure_bucket_dir(self.root, subfolder_path)
+        objects = dal_wasabi.list_all_objects(self.s3, bucket_name=self.bucket_root, prefix=prefix, delimiter=None if recursive else '/')
+
+        def fetch(key:str):
+            obj = dal_wasabi.get_object(self.s3, bucket_name=self.bucket_root, bucket_dir='', file_name=key)
+            if not obj:
+                return None
+            return obj['Body'].read(ZIP_READAHEAD_BYTES), obj['Body']
+
+        pending = deque()
+        def fill():
+            while len(pending) < ZIP_READAHEAD_FILES:
+                obj = next(objects, None)
+                if obj is None:
+                    return
+                if obj['Key'] == prefix:
+                    continue
+                future = _zip_pool.submit(fetch, obj['Key']) if not obj['Key'].endswith('/') else None
+                pending.append((obj, future))
+
+        stream = ZipStream()
+        def flush():
+            data = stream.pop()
+            if data:
+                yield data
+
+        try:
+            with zipfile.ZipFile(stream, mode='w', compression=zipfile.ZIP_DEFLATED, allowZip64=True) as zf:
+                fill()
+                while pending:
+                    obj, future = pending.popleft()
+                    fill()
+                    name = obj['Key'][len(prefix):]
+                    info = zipfile.ZipInfo(name, date_time=obj['LastModified'].timetuple()[:6])
+                    if future is None:
+                        # diretório (marcador): mantém diretórios vazios no zip
+                        zf.writestr(info, b'')
+                        continue
+                    fetched = future.result()
+                    if not fetched:
+                        continue
+                    first, body = fetched
+                    info.compress_type = zipfile.ZIP_STORED if Path(name).suffix[1:].lower() in ZIP_STORED_EXTENSIONS else zipfile.ZIP_DEFLATED
+                    try:
+                        with zf.open(info, mode='w', force_zip64=obj['Size'] >= zipfile.ZIP64_LIMIT) as dest:
+                            dest.write(first)
+                            yield from flush()
+                            while True:
+                                chunk = body.read(ZIP_CHUNK_SIZE)
+                                if not chunk:
+                                    break
+                                dest.write(chunk)
+                                yield from flush()
+                    finally:
+                        body.close()
+                    yield from flush()
+            yield from flush()
+        finally:
+            # cliente desconectou: descarta o que já estava sendo lido
+            for obj, future in pending:
+                if future and not future.cancel():
+                    fetched = future.result()
+                    if fetched:
+                        fetched[1].close()
+
     def move_folder(self, old_subfolder_path:str, new_subfolder_path:str) -> bool:
-        def new_root_folder(object_list, old_dir, new_dir):
-            for f in object_list['Contents']:
-                if f['Size'] == 0:
-                    folder_name = str(f['Key'])
-                    folder_name = folder_name.replace(old_dir, new_dir)
-                    x = dal_wasabi.put_object(s3_client=self.s3, bucket_name=self.bucket_root, key_name=folder_name)
-                    print(x)
-
-        def move_files(object_list, old_dir, new_dir):
-            for f in object_list['Contents']:
-                old_file = str(f['Key'])
-                if f['Size'] > 0 and old_file.__contains__(old_dir):
-                    file_name = old_file.replace(old_dir, new_dir)
-                    x = dal_wasabi.copy_objects(s3_client=self.s3, bucket_name_from=self.bucket_root, bucket_name_to=self.bucket_root, from_object=old_file, to_object=file_name)
-                    print(x, old_file, file_name)
-        
-        def recursive_folder_delete(object_list, old_dir):
-            for f in object_list['Contents']:
-                old_file = str(f['Key'])
-                old_folder = ensure_folder_ends(old_dir)
-
-                if old_file.__contains__(old_folder):
-                    dal_wasabi.delete_object(s3_client=self.s3, bucket_name=self.bucket_root, key_name=old_file)
-
-        if old_subfolder_path != new_subfolder_path and old_subfolder_path not in diretorios_sistema:
-            objects = dal_wasabi.list_objects(self.s3, bucket_name=self.bucket_root, root=self.root_dir, folder_name=old_subfolder_path)
-            new_root_folder(objects, old_subfolder_path, new_subfolder_path)
-            move_files(objects, old_subfolder_path, new_subfolder_path)
-            recursive_folder_delete(objects, old_subfolder_path)
-        return True
+        return not self.move_tree(old_subfolder_path, new_subfolder_path)['failed']
 
-    def size_folder(self, subfolder_path:str) -> list:
-        def folder_size(subfolder_path):
-            if [True for x in dir_size if subfolder_path == x['dir']] == [True]:
-                return
-            object_list = dal_wasabi.list_objects(self.s3, bucket_name=self.bucket_root, root=self.root_dir, folder_name=subfolder_path)
-            dirs, files, size = 0, 0, 0
-            for f in object_list['Contents']:
-                if f['Size'] != 0:
-                    size += f['Size']
-                    files += 1
-                else:
-                    if str(f['Key']) != subfolder_path:
-                        dirs += 1
-                        folder_size(str(f['Key']))    
-            dir_size.append( {'dir':subfolder_path, 'size':size, 'diretorios': dirs, 'arquivos': files})
-        dir_size = list()
-        folder_size(subfolder_path)
-        return dir_size
+    def move_tree(self, old_subfolder_path:str, new_subfolder_path:str, progress=None) -> dict:
+        # lista o prefixo inteiro (paginado), copia tudo em paralelo no servidor e só então
+        # apaga as origens com delete_objects em lotes; se alguma cópia falhar nada é apagado
+        # progress(etapa, feitos, total) com etapa em 'copy' / 'delete'
+        result = {'total': 0, 'copied': 0, 'deleted': 0, 'failed': dict(), 'keys': dict()}
+        if old_subfolder_path == new_subfolder_path or old_subfolder_path in diretorios_sistema:
+            return result
+        old_prefix = ensure_bucket_dir(self.root, old_subfolder_path)
+        new_prefix = ensure_bucket_dir(self.root, new_subfolder_path)
+        if new_prefix.startswith(old_prefix):
+            result['failed'][old_prefix] = 'destino dentro da origem'
+            return result
+
+        sizes = {obj['Key']: obj['Size'] for obj in dal_wasabi.list_partitioned(self.s3, bucket_name=self.bucket_root, prefix=old_prefix)}
+        keys = list(sizes)
+        result['total'] = len(keys)
+        moved = False
+        try:
+            copies = dal_wasabi.copy_keys(self.s3, bucket_name=self.bucket_root, pairs=[(k, new_prefix + k[len(old_prefix):]) for k in keys], sizes=sizes,
+                                          progress=(lambda done, total: progress('copy', done, total)) if progress else None)
+            result['copied'] = sum(1 for error in copies.values() if error is None)
+            result['failed'] = {k: error for k, error in copies.items() if error}
+            result['keys'] = {k: 'copied' if error is None else 'copy failed' for k, error in copies.items()}
+            if result['failed']:
+                return result
 
+            deletes = dal_wasabi.delete_keys(self.s3, bucket_name=self.bucket_root, keys=keys,
+                                             progress=(lambda done, total: progress('delete', done, total)) if progress else None)
+            result['deleted'] = sum(1 for error in deletes.values() if error is None)
+            result['failed'] = {k: error for k, error in deletes.items() if error}
+            result['keys'] = {k: 'moved' if error is None else 'delete failed' for k, error in deletes.items()}
+            moved = not result['failed']
+            return result
+        finally:
+            if moved:
+                tree_moved(old_prefix, new_prefix, [(new_prefix + k[len(old_prefix):], size) for k, size in sizes.items()])
+            else:
+                tree_changed(old_prefix)
+                tree_changed(new_prefix)
+
+    def size_folder(self, subfolder_path:str) -> list:
+        # uma varredura paginada do prefixo monta a árvore inteira no índice; depois disso as
+        # escritas o mantêm atualizado e a leitura não vai ao S3
+        prefix = ensure_bucket_dir(self.root, subfolder_path)
+        if not _size_index.covered(prefix):
+            _size_index.build(prefix, ({'Key': key, 'Size': size} for key, size, modified, etag, user in tree_entries(prefix)))
+        return [{'dir': d[len(self.root_dir):], 'size': size, 'diretorios': dirs, 'arquivos': files}
+                for d, size, files, dirs in _size_index.tree(prefix)]
 
     def move_file(self, origin_subfolder_path:str, dest_subfolder_path:str, filename:str, override:bool=False) -> bool:
         if origin_subfolder_path != dest_subfolder_path:
@@ -151,6 +650,7 @@ class Wasabi(object):
                     return False
             dal_wasabi.copy_objects(s3_client=self.s3, bucket_name_from=self.bucket_root, bucket_name_to=self.bucket_root, from_object=old_file, to_object=new_file)
             dal_wasabi.delete_object(s3_client=self.s3, bucket_name=self.bucket_root, key_name=old_file)
+            object_moved(old_file, new_file)
         return True
 
     def rename_file(self, subfolder_path:str, filename:str, new_filename:str, override:bool=False) -> bool:
@@ -164,38 +664,25 @@ class Wasabi(object):
                     return False
             dal_wasabi.copy_objects(s3_client=self.s3, bucket_name_from=self.bucket_root, bucket_name_to=self.bucket_root, from_object=old_file, to_object=new_file)
             dal_wasabi.delete_object(s3_client=self.s3, bucket_name=self.bucket_root, key_name=old_file)
+            object_moved(old_file, new_file)
         return True
 
-    def find_file(self, folder_path:str, searched_name:str) -> list:
+    def find_file(self, folder_path:str, searched_name:str, offset:int=0, limit:int=None) -> list:
+        # busca por substring do nome (sem acentos, sem caixa) em toda a árvore do diretório;
+        # uma varredura paginada (com as tags de usuário) monta o índice, depois as escritas o
+        # mantêm e a consulta não vai ao S3
+        prefix = ensure_bucket_dir(self.root, folder_path)
+        if not _name_index.covered(prefix):
+            objects = list(tree_entries(prefix))
+            _name_index.build(prefix, ((key, size, modified, user) for key, size, modified, etag, user in objects))
+
         found_objects = list()
-        objects = dal_wasabi.list_objects(self.s3, bucket_name=self.bucket_root, root=self.root_dir, folder_name=folder_path)
-        # guarda os objetos achados
-        for obj in objects['Contents']:
-            name = obj['Key'].replace(ensure_folder_ends(self.root),'')
-            if searched_name.casefold() in name.replace(folder_path,'').casefold():
-                found_objects.append({  'obj': name
-                                      , 'name': Path(obj['Key']).stem
-                                      , 'type': Path(obj['Key']).suffix[1:]
-                                      , 'size': obj['Size']
-                                      , 'isdir': obj['Size'] == 0
-                                      , 'modified': obj['LastModified']
-                                      , 'user': dal_wasabi.get_tag(self.s3, bucket_name=self.bucket_root, file_path=obj['Key'], tag_key_to_query='username') if obj['Size'] > 0 else ''
-                                      , 'system': name in diretorios_sistema  
-                                      })
-
-        #for l in found_objects:
-        #    l['user'] = dal_wasabi.get_tag(self.s3, bucket_name=self.bucket_root, file_path=l['obj'], tag_key_to_query='username') if not l['isdir'] else ''
-        #    l['obj'] = l['obj'].replace(ensure_folder_ends(self.root),'')
-        #    l['system'] = l['obj'] in diretorios_sistema        
-
-        # e mergulha nos subdiretorios (recursivo)
-        #for obj in objects.get('Contents',list()):
-        #    # se for diretorio, mergulha !
-        #    if obj['Size'] == 0:
-        #        found_objects += self.find_file(folder_path=obj['key'], searched_name=searched_name)
-            
+        for key, size, modified, user in _name_index.search(prefix, searched_name, offset=offset, limit=limit if limit is not None else FIND_PAGE_SIZE):
+            name = key.replace(ensure_folder_ends(self.root),'')
+            isdir = key.endswith('/')
+            found_objects.append(dal_entry.Entry(name, Path(key).name if isdir else Path(key).stem, type='' if isdir else Path(key).suffix[1:], size_b=size or 0, isdir=isdir,
+                                                 modified=datetime.fromtimestamp(modified, timezone.utc), user=user, system=name in diretorios_sistema))
         return found_objects
-        #return dal_wasabi.find_object(self.s3, bucket_name=self.bucket_root, bucket_dir=ensure_bucket_dir(self.root, subfolder_path), file_name=filename) 
 
     def create_s3_external_client(self, user_name:str):
         # Create the IAM user
@@ -292,26 +779,106 @@ class Wasabi(object):
         except Exception as e:
             print(f"Error: {e}")
 
-    def get_object(self, bucket_dir:str, file_name:str) -> dict:
-        return dal_wasabi.get_object(self.s3, bucket_name=self.bucket_root, bucket_dir=ensure_bucket_dir(self.root,bucket_dir), file_name=file_name)
+    def get_object(self, bucket_dir:str, file_name:str, byte_range:str=None, if_match:str=None) -> dict:
+        return dal_wasabi.get_object(self.s3, bucket_name=self.bucket_root, bucket_dir=ensure_bucket_dir(self.root,bucket_dir), file_name=file_name, byte_range=byte_range, if_match=if_match)
+
+    def head_object(self, bucket_dir:str, file_name:str) -> dict:
+        key_name = f"{ensure_bucket_dir(self.root,bucket_dir)}{file_name}"
+        head = _head_cache.get(key_name, self.bucket_root)
+        if head is None:
+            token = _head_cache.token()
+            head = dal_wasabi.head_object(self.s3, bucket_name=self.bucket_root, bucket_dir=ensure_bucket_dir(self.root,bucket_dir), file_name=file_name)
+            if head:
+                _head_cache.set(key_name, self.bucket_root, head, token=token)
+        return head
+
+    def forget_head(self, bucket_dir:str, file_name:str) -> None:
+        # o HEAD em cache não vale mais (ex. objeto sobrescrito por um cliente IAM)
+        invalidate_head(f"{ensure_bucket_dir(self.root,bucket_dir)}{file_name}")
+
+    def presigned_url(self, bucket_dir:str, file_name:str, expires:int, content_disposition:str=None, content_type:str=None) -> str:
+        return dal_wasabi.presigned_get_url(self.s3, bucket_name=self.bucket_root, key_name=f"{ensure_bucket_dir(self.root,bucket_dir)}{file_name}", expires=expires,
+                                            content_disposition=content_disposition, content_type=content_type)
     
     def put_object(self, bucket_dir:str, obj_name:str, obj_data:any, user:str=None) -> dict:
-        resp = dal_wasabi.put_object(self.s3, bucket_name=self.bucket_root, key_name=f"{ensure_bucket_dir(self.root,bucket_dir)}{obj_name}", body=obj_data)
+        if isinstance(obj_data, str):
+            # conteúdo, não caminho (fileobj_size/upload_multipart tratam str como caminho)
+            obj_data = obj_data.encode('utf-8')
+        size = dal_wasabi.fileobj_size(obj_data)
+        if size is not None and size >= dal_wasabi.MULTIPART_THRESHOLD:
+            resp = dal_wasabi.upload_multipart(self.s3, bucket_name=self.bucket_root, key_name=f"{ensure_bucket_dir(self.root,bucket_dir)}{obj_name}", source=obj_data)
+        else:
+            resp = dal_wasabi.put_object(self.s3, bucket_name=self.bucket_root, key_name=f"{ensure_bucket_dir(self.root,bucket_dir)}{obj_name}", body=obj_data)
         if user:
             dal_wasabi.put_tag(self.s3, bucket_name=self.bucket_root, file_path=f"{ensure_bucket_dir(self.root,bucket_dir)}{obj_name}", key="username", value=user)
+        object_written(f"{ensure_bucket_dir(self.root,bucket_dir)}{obj_name}", size, user)
+        return resp
+
+    def start_upload(self, bucket_dir:str, obj_name:str) -> str:
+        # upload em partes (chunked/resumível): cada chunk do browser é uma parte do multipart
+        return dal_wasabi.create_multipart_upload(self.s3, bucket_name=self.bucket_root, key_name=f"{ensure_bucket_dir(self.root,bucket_dir)}{obj_name}")
+
+    def upload_chunk(self, bucket_dir:str, obj_name:str, upload_id:str, part_number:int, data:bytes) -> dict:
+        return dal_wasabi.upload_part(self.s3, bucket_name=self.bucket_root, key_name=f"{ensure_bucket_dir(self.root,bucket_dir)}{obj_name}", upload_id=upload_id, part_number=part_number, data=data)
+
+    def presigned_chunk_urls(self, bucket_dir:str, obj_name:str, upload_id:str, part_numbers:list, expires:int) -> dict:
+        # {part_number: url} para o browser enviar as partes direto ao bucket
+        return {n: dal_wasabi.presigned_upload_part_url(self.s3, bucket_name=self.bucket_root, key_name=f"{ensure_bucket_dir(self.root,bucket_dir)}{obj_name}", upload_id=upload_id, part_number=n, expires=expires)
+                for n in part_numbers}
+
+    def uploaded_chunks(self, bucket_dir:str, obj_name:str, upload_id:str) -> list:
+        return dal_wasabi.list_parts(self.s3, bucket_name=self.bucket_root, key_name=f"{ensure_bucket_dir(self.root,bucket_dir)}{obj_name}", upload_id=upload_id)
+
+    def complete_upload(self, bucket_dir:str, obj_name:str, upload_id:str, parts:list, user:str=None) -> dict:
+        key_name = f"{ensure_bucket_dir(self.root,bucket_dir)}{obj_name}"
+        resp = dal_wasabi.complete_multipart_upload(self.s3, bucket_name=self.bucket_root, key_name=key_name, upload_id=upload_id, parts=parts)
+        if user:
+            dal_wasabi.put_tag(self.s3, bucket_name=self.bucket_root, file_path=key_name, key="username", value=user)
+        sizes = [p.get('Size') for p in parts]
+        object_written(key_name, None if None in sizes else sum(sizes), user)
         return resp
 
+    def abort_upload(self, bucket_dir:str, obj_name:str, upload_id:str) -> dict:
+        return dal_wasabi.abort_multipart_upload(self.s3, bucket_name=self.bucket_root, key_name=f"{ensure_bucket_dir(self.root,bucket_dir)}{obj_name}", upload_id=upload_id)
+
     def upload(self, bucket_dir:str, file_dir:str, file_name:str):
-        dal_wasabi.upload_file(self.s3, bucket_name=self.bucket_root, bucket_dir=ensure_bucket_dir(self.root,bucket_dir), file_dir=ensure_folder_ends(file_dir), filename=file_name)        
+        size = os.path.getsize(ensure_folder_ends(file_dir) + file_name)
+        if size >= dal_wasabi.MULTIPART_THRESHOLD:
+            dal_wasabi.upload_largefile(self.s3, bucket_name=self.bucket_root, bucket_dir=ensure_bucket_dir(self.root,bucket_dir), file_dir=ensure_folder_ends(file_dir), filename=file_name)
+        else:
+            dal_wasabi.upload_file(self.s3, bucket_name=self.bucket_root, bucket_dir=ensure_bucket_dir(self.root,bucket_dir), file_dir=ensure_folder_ends(file_dir), filename=file_name)        
+        object_written(f"{ensure_bucket_dir(self.root,bucket_dir)}{file_name}", size)
 
     def download(self, bucket_dir:str, file_dir:str, file_name:str):
         dal_wasabi.donwload_file(self.s3, bucket_name=self.bucket_root, bucket_dir=ensure_bucket_dir(self.root,bucket_dir), file_dir=ensure_folder_ends(file_dir), filename=file_name)        
         
     def delete(self, bucket_dir:str, file_name:str):
         dal_wasabi.delete_object(self.s3, bucket_name=self.bucket_root, key_name=f"{ensure_bucket_dir(self.root,bucket_dir)}{file_name}")
+        object_removed(f"{ensure_bucket_dir(self.root,bucket_dir)}{file_name}")
 
     def delete_objects(self, key_names):
-        dal_wasabi.delete_objects(self.s3, bucket_name=self.bucket_root, Delete={'Objects': key_names})
+        dal_wasabi.delete_objects(self.s3, bucket_name=self.bucket_root, del_objects=key_names)
+        for obj in key_names:
+            object_removed(obj['Key'])
+
+
+
+class AsyncWasabi(object):
+    # fachada async: cada método de Wasabi vira uma corrotina executada no S3_EXECUTOR,
+    # sem bloquear o event loop
+    
+    def __init__(self, root:str=""):
+        self.wasabi = Wasabi(root)
+
+    def __getattr__(self, name:str):
+        attr = getattr(self.wasabi, name)
+        if not callable(attr):
+            return attr
+
+        @functools.wraps(attr)
+        async def call(*args, **kwargs):
+            return await run_s3(attr, *args, **kwargs)
+        return call
 
 #wb = Wasabi()
 #print(wb.size_folder(''))
\ No newline at end of file
@@ -0,0 +1,224 @@
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from dal import dal_index
+
+
+class LRUCache(object):
+    # cache em memória, thread-safe, limitado por quantidade de entradas
+    # ttl (segundos) opcional: entradas vencidas são descartadas na leitura
+    # generation: incrementa a cada invalidação; set(..., generation=g) ignora valores
+    # calculados antes de uma invalidação concorrente
+
+    def __init__(self, maxsize:int=1024, ttl:float=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.generation = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                expires, value = self._data[key]
+            except KeyError:
+                return default
+            if expires is not None and expires < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, generation:int=None, ttl:float=None) -> None:
+        # ttl do set (ex. o que resta da entrada no cache compartilhado) vale sobre o da instância
+        ttl = ttl if ttl is not None else self.ttl
+        expires = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            self.generation += 1
+            item = self._data.pop(key, None)
+        return item[1] if item else default
+
+    def pop_where(self, predicate) -> int:
+        # remove todas as chaves em que predicate(key) é verdadeiro
+        with self._lock:
+            self.generation += 1
+            keys = [k for k in self._data if predicate(k)]
+            for k in keys:
+                del self._data[k]
+        return len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self.generation += 1
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class SharedCache(dal_index.SQLiteStore):
+    # cache do host (sqlite em WAL) compartilhado pelos workers: valores em pickle com validade,
+    # por (ns, key, variant). Invalidações são por key (exata ou todo o prefixo, recursive) e
+    # ficam também num log de eventos que cada processo lê para limpar o seu cache em memória.
+    # Eventos mais velhos que retention são descartados.
+
+    schema = '''
+        CREATE TABLE IF NOT EXISTS cache_entries (ns TEXT, key TEXT, variant TEXT, value BLOB, expires REAL, PRIMARY KEY (ns, key, variant)) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS cache_events (seq INTEGER PRIMARY KEY AUTOINCREMENT, ns TEXT, key TEXT, recursive INTEGER, at REAL);
+    '''
+
+    def __init__(self, path:str, retention:float=3600):
+        self.retention = retention
+        self._pruned_at = 0
+        super().__init__(path)
+
+    def get(self, ns:str, key:str, variant:str=''):
+        # (valor, segundos restantes) ou None; leitura sem transação de escrita
+        row = self._connect().execute("SELECT value, expires FROM cache_entries WHERE ns = ? AND key = ? AND variant = ?", (ns, key, variant)).fetchone()
+        if row is None:
+            return None
+        remaining = row[1] - time.time() if row[1] is not None else None
+        if remaining is not None and remaining <= 0:
+            return None
+        return pickle.loads(row[0]), remaining
+
+    def set(self, ns:str, key:str, value, variant:str='', ttl:float=None, since:int=None) -> bool:
+        return bool(self.set_many(ns, [(key, variant, value)], ttl=ttl, since=since))
+
+    def set_many(self, ns:str, items:list, ttl:float=None, since:int=None) -> list:
+        # items: [(key, variant, valor)], numa transação; retorna as keys gravadas.
+        # since: last_event() de antes de calcular os valores; key invalidada depois disso
+        # (em qualquer processo) tem valor já velho e não é gravada
+        expires = time.time() + ttl if ttl else None
+        with self.connection() as con:
+            exact, trees = set(), list()
+            if since is not None:
+                for ev_key, recursive in con.execute("SELECT key, recursive FROM cache_events WHERE seq > ? AND ns = ?", (since, ns)):
+                    (trees.append if recursive else exact.add)(ev_key)
+            trees = tuple(trees)
+            items = [(key, variant, value) for key, variant, value in items if key not in exact and not (trees and key.startswith(trees))]
+            con.executemany("INSERT OR REPLACE INTO cache_entries (ns, key, variant, value, expires) VALUES (?, ?, ?, ?, ?)",
+                            ((ns, key, variant, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), expires) for key, variant, value in items))
+        self._prune()
+        return [key for key, variant, value in items]
+
+    def invalidate(self, ns:str, keys, recursive:bool=False) -> None:
+        now = time.time()
+        keys = list(keys)
+        with self.connection() as con:
+            for key in keys:
+                if recursive:
+                    con.execute("DELETE FROM cache_entries WHERE ns = ? AND key >= ? AND key < ?", (ns, key, dal_index.prefix_end(key)))
+                else:
+                    con.execute("DELETE FROM cache_entries WHERE ns = ? AND key = ?", (ns, key))
+            con.executemany("INSERT INTO cache_events (ns, key, recursive, at) VALUES (?, ?, ?, ?)", ((ns, key, int(recursive), now) for key in keys))
+
+    def last_event(self) -> int:
+        return self._connect().execute("SELECT coalesce(max(seq), 0) FROM cache_events").fetchone()[0]
+
+    def events(self, since:int) -> list:
+        # [(seq, ns, key, recursive)] gravados depois de since
+        return self._connect().execute("SELECT seq, ns, key, recursive FROM cache_events WHERE seq > ? ORDER BY seq", (since,)).fetchall()
+
+    def _prune(self) -> None:
+        # no máximo uma vez por minuto em cada processo
+        now = time.time()
+        if now - self._pruned_at < 60:
+            return
+        self._pruned_at = now
+        with self.connection() as con:
+            con.execute("DELETE FROM cache_entries WHERE expires < ?", (now,))
+            con.execute("DELETE FROM cache_events WHERE at < ?", (now - self.retention,))
+
+
+class TieredCache(object):
+    # LRUCache do processo (L1) na frente de um SharedCache do host (L2, opcional) num namespace.
+    # Chaves (key, variant): key é o que as invalidações casam (ex. o prefixo da listagem),
+    # variant distingue valores da mesma key (ex. o root do tenant). Antes de cada leitura o L1
+    # aplica os eventos de invalidação gravados pelos outros processos. Sem L2 é só o LRUCache.
+
+    def __init__(self, shared:SharedCache, ns:str, maxsize:int=1024, ttl:float=None):
+        self.shared = shared
+        self.ns = ns
+        self.ttl = ttl
+        self.local = LRUCache(maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        self._seen = shared.last_event() if shared else 0
+        self._synced_at = time.monotonic()
+
+    def sync(self) -> None:
+        if self.shared is None:
+            return
+        with self._lock:
+            if time.monotonic() - self._synced_at > self.shared.retention:
+                # eventos podem ter sido descartados antes de serem lidos aqui
+                self.local.clear()
+            self._synced_at = time.monotonic()
+            events = self.shared.events(self._seen)
+            if not events:
+                return
+            self._seen = events[-1][0]
+        exact = {key for seq, ns, key, recursive in events if ns == self.ns and not recursive}
+        trees = tuple(key for seq, ns, key, recursive in events if ns == self.ns and recursive)
+        if exact or trees:
+            self.local.pop_where(lambda k: k[0] in exact or (trees and k[0].startswith(trees)))
+
+    def token(self) -> tuple:
+        # marca tirada antes de calcular um valor; set(..., token=t) descarta o valor se houve
+        # invalidação depois dela (neste ou em outro processo)
+        return (self.local.generation, self.shared.last_event() if self.shared else None)
+
+    def get(self, key:str, variant='', shared:bool=True):
+        return self.get_many([(key, variant)], shared=shared).get((key, variant))
+
+    def get_many(self, keys:list, shared:bool=True) -> dict:
+        # {(key, variant): valor} do que estiver em cache; os eventos são lidos uma vez
+        self.sync()
+        found = dict()
+        generation = self.local.generation
+        for k in keys:
+            value = self.local.get(k)
+            if value is None and shared and self.shared is not None:
+                entry = self.shared.get(self.ns, *k)
+                if entry is not None:
+                    value, remaining = entry
+                    self.local.set(k, value, generation=generation, ttl=remaining)
+            if value is not None:
+                found[k] = value
+        return found
+
+    def set(self, key:str, variant, value, token:tuple=None, shared:bool=True) -> None:
+        # shared=False: só no processo (ex. dado derivado, barato de recalcular a partir do L2)
+        self.set_many([(key, variant, value)], token=token, shared=shared)
+
+    def set_many(self, items:list, token:tuple=None, shared:bool=True) -> None:
+        # items: [(key, variant, valor)]; uma única escrita no L2
+        generation, since = token if token else (None, None)
+        if shared and self.shared is not None and items:
+            stored = set(self.shared.set_many(self.ns, items, ttl=self.ttl, since=since))
+            items = [item for item in items if item[0] in stored]
+        for key, variant, value in items:
+            self.local.set((key, variant), value, generation=generation)
+
+    def invalidate(self, keys, recursive:bool=False) -> None:
+        keys = set(keys)
+        if not keys:
+            return
+        if recursive:
+            trees = tuple(keys)
+            self.local.pop_where(lambda k: k[0].startswith(trees))
+        else:
+            self.local.pop_where(lambda k: k[0] in keys)
+        if self.shared is not None:
+            self.shared.invalidate(self.ns, keys, recursive=recursive)
@@ -0,0 +1,107 @@
+import mimetypes
+from datetime import datetime, timezone
+
+# tipos de arquivo da interface: mediatype -> [extensões, ícone]
+tp_dict = {
+    "image": [["png", "jpg", "svg", "jpeg", "png", "gif", "bmp", "raw"], "fa fa-file-image"],
+    "audio": [["mp3", "wav", "ogg", "mpeg", "aac", "3gpp", "3gpp2", "aiff", "x-aiff", "amr", "mpga", "m4a","flac"], "fa fa-file-audio"],
+    "video": [["mp4", "webm", "opgg", "flv", "mov", "mkv"], "fa fa-file-video"],
+    "pdf": [["pdf"], "fa fa-file-pdf"],
+    "ppt": [["ppt", "pptx", "odp"], "fa fa-file-powerpoint"],
+    "doc": [["docx", "doc", "odt"], "fa fa-file-word"],
+    "excel": [["xls", "xlsx", "ods"], "fa fa-file-excel"],
+    "text": [["txt", "rtf", "csv", "log", "xml", "md"], "fa fa-file-alt"],
+    "compressed": [["zip", "rar", "7z"], "fa a-file-alt"],
+    "code": [["css", "scss", "html", "py", "js", "cpp"], "fa fa-file-code"],
+}
+
+NAME_LENGTH = 64
+DIR_DATE = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+
+def _ext_table() -> dict:
+    table = dict()
+    for mediatype, (extensions, icon) in tp_dict.items():
+        for ext in extensions:
+            table.setdefault(ext, (mediatype, icon, mimetypes.guess_type(f"file.{ext}")[0]))
+    return table
+
+# extensão (minúscula) -> (mediatype, ícone, mime); as desconhecidas entram na primeira consulta
+EXT_TABLE = _ext_table()
+
+
+def ext_info(ext:str) -> tuple:
+    ext = (ext or '').lower()
+    info = EXT_TABLE.get(ext)
+    if info is None:
+        info = EXT_TABLE.setdefault(ext, ('', 'fa fa-file', mimetypes.guess_type(f"file.{ext}")[0] if ext else None))
+    return info
+
+
+def format_size(size:int) -> str:
+    filesizeK = size / 1024.0
+    if filesizeK < 1000:
+        return "%.2fK" % filesizeK
+    if filesizeK / 1024 < 1000:
+        return "%.2fM" % (filesizeK / 1024)
+    return "%.2fG" % (filesizeK / 1024 / 1024)
+
+
+class Entry(object):
+    # uma linha de listagem (arquivo ou diretório), criada uma vez pelo dal e usada sem cópia
+    # pelo controller (cache) e pela view; depois de entrar no cache não é mais alterada.
+    # Os campos de exibição (f, icon, dtm, size...) são calculados só para as linhas exibidas.
+
+    __slots__ = ('obj', 'name', 'type', 'size_b', 'isdir', 'modified', 'etag', 'user', 'system')
+
+    def __init__(self, obj:str, name:str, type:str='', size_b:int=0, isdir:bool=False, modified:datetime=None, etag:str=None, user:str='', system:bool=False):
+        self.obj = obj
+        self.name = name
+        self.type = type
+        self.size_b = size_b
+        self.isdir = isdir
+        self.modified = modified
+        self.etag = etag
+        self.user = user
+        self.system = system
+
+    def __repr__(self) -> str:
+        return f"Entry({self.obj!r})"
+
+    @property
+    def f(self) -> str:
+        return self.name[0:NAME_LENGTH] + ("..." if len(self.name) > NAME_LENGTH else "")
+
+    @property
+    def f_url(self) -> str:
+        return self.obj
+
+    @property
+    def filetype(self) -> str:
+        return "" if self.isdir else self.type
+
+    @property
+    def mediatype(self) -> str:
+        return "" if self.isdir else ext_info(self.type)[0]
+
+    @property
+    def icon(self) -> str:
+        return "fa fa-folder" if self.isdir else ext_info(self.type)[1]
+
+    @property
+    def mime(self) -> str:
+        return None if self.isdir else ext_info(self.type)[2]
+
+    @property
+    def dtm_b(self) -> datetime:
+        if self.isdir or self.modified is None:
+            return DIR_DATE
+        return self.modified if self.modified.tzinfo is not None else self.modified.replace(tzinfo=timezone.utc)
+
+    @property
+    def dtm(self) -> str:
+        return "" if self.isdir else self.dtm_b.strftime("%d/%m/%Y %H:%M:%S")
+
+    @property
+    def size(self) -> str:
+        return "---" if self.isdir else format_size(self.size_b)
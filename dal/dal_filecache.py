@@ -0,0 +1,147 @@
+import asyncio
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import asynccontextmanager, contextmanager
+
+from dal import dal_wasabi
+
+
+def mirror(s3_client, bucket_name:str, path:str, key_name:str) -> None:
+    # envia uma entrada do cache para o bucket (compartilhada com os outros servidores)
+    try:
+        with open(path, 'rb') as f:
+            dal_wasabi.put_object(s3_client, bucket_name=bucket_name, key_name=key_name, body=f)
+    except Exception as e:
+        # o espelho é só otimização; a entrada já está no cache local
+        print(f"Error: {e}")
+
+
+class KeyLocks(object):
+    # um lock por chave (ex. objeto + ETag), para gerar cada entrada uma vez neste processo.
+    # Vale entre threads (lock) e corrotinas (alock, espera sem bloquear o event loop); a
+    # entrada sai do dicionário quando o dono solta o lock
+
+    def __init__(self):
+        self._held = dict()  # chave -> Future concluído quando o dono soltar
+        self._guard = threading.Lock()
+
+    def _try(self, key:str) -> Future:
+        # None = lock obtido; senão o Future a esperar antes de tentar de novo
+        with self._guard:
+            held = self._held.get(key)
+            if held is None:
+                held = self._held[key] = Future()
+                held.set_running_or_notify_cancel()  # quem espera não consegue cancelá-lo
+                return None
+            return held
+
+    def _release(self, key:str) -> None:
+        with self._guard:
+            self._held.pop(key).set_result(None)
+
+    @contextmanager
+    def lock(self, key:str):
+        while (held := self._try(key)) is not None:
+            held.result()
+        try:
+            yield
+        finally:
+            self._release(key)
+
+    @asynccontextmanager
+    async def alock(self, key:str):
+        while (held := self._try(key)) is not None:
+            await asyncio.wrap_future(held)
+        try:
+            yield
+        finally:
+            self._release(key)
+
+
+class DiskCache(object):
+    # cache LRU em disco, limitado em bytes, compartilhado pelos workers do host.
+    # Cada entrada é um arquivo com nome derivado da chave; o mtime marca o último uso.
+    # Escritas vão para um temporário no mesmo diretório e entram com os.replace (atômico).
+    # Entradas usadas há menos de `grace` segundos não são removidas (podem estar sendo enviadas).
+
+    def __init__(self, directory:str, max_bytes:int, suffix:str='', grace:float=60):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self.grace = grace
+        os.makedirs(directory, exist_ok=True)
+
+    def path_for(self, key:str) -> str:
+        return os.path.join(self.directory, hashlib.sha256(key.encode('utf-8')).hexdigest() + self.suffix)
+
+    def get(self, key:str) -> str:
+        # caminho da entrada (e marca o uso) ou None
+        path = self.path_for(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def put_file(self, key:str, src_path:str) -> str:
+        # move (ou copia, se estiver em outro filesystem) o arquivo para dentro do cache
+        path = self.path_for(key)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix='.tmp-')
+        os.close(fd)
+        try:
+            shutil.move(src_path, tmp)
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        self.evict()
+        return path
+
+    def put_stream(self, key:str, fileobj, chunk_size:int=1024 * 1024) -> str:
+        # grava um file-like (ex. StreamingBody) em pedaços, sem carregar tudo em memória
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                shutil.copyfileobj(fileobj, f, chunk_size)
+        except BaseException:
+            os.remove(tmp)
+            raise
+        return self.put_file(key, tmp)
+
+    def evict(self) -> None:
+        entries = list()
+        total = 0
+        now = time.time()
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                try:
+                    st = entry.stat()
+                except FileNotFoundError:
+                    continue
+                if entry.name.startswith('.tmp-'):
+                    # temporário abandonado (worker morreu no meio da escrita)
+                    if st.st_mtime + 24 * 3600 < now:
+                        self._remove(entry.path)
+                    continue
+                total += st.st_size
+                entries.append((st.st_mtime, st.st_size, entry.path))
+        entries.sort()
+        for mtime, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            if mtime + self.grace > now:
+                break
+            self._remove(path)
+            total -= size
+
+    def _remove(self, path:str) -> None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,33 @@
+try:
+    from PIL import Image, ImageOps, features
+except ImportError:  # Pillow é opcional: sem ele não há miniaturas
+    Image = None
+
+# módulo leve de propósito: roda nos processos do pool de miniaturas, que só importam isto
+
+
+def available() -> bool:
+    return Image is not None
+
+
+def webp_available() -> bool:
+    return Image is not None and features.check('webp')
+
+
+def render(src_path:str, outputs:list, quality:int=80) -> list:
+    # outputs: [(lado máximo em px, formato 'webp'/'jpeg', caminho de destino)]; decodifica a
+    # origem uma vez e gera da maior para a menor rendição
+    with Image.open(src_path) as im:
+        largest = max(size for size, fmt, dest in outputs)
+        # JPEG: decodifica já reduzido (bem mais rápido em fotos de câmera)
+        im.draft('RGB', (largest, largest))
+        im = ImageOps.exif_transpose(im)
+        if im.mode not in ('RGB', 'RGBA'):
+            im = im.convert('RGBA' if 'transparency' in im.info or im.mode in ('LA', 'PA') else 'RGB')
+        done = list()
+        for size, fmt, dest in sorted(outputs, reverse=True):
+            im.thumbnail((size, size), Image.LANCZOS)
+            out = im.convert('RGB') if fmt == 'jpeg' and im.mode != 'RGB' else im
+            out.save(dest, format=fmt.upper(), quality=quality, **({'method': 4} if fmt == 'webp' else {'optimize': True}))
+            done.append(dest)
+        return done
@@ -0,0 +1,551 @@
+import os
+import sqlite3
+import threading
+import time
+
+
+def key_dirs(key:str, base:str='') -> list:
+    # diretórios ('/' no fim) que contêm a chave, do mais raso ao mais fundo, a partir de base;
+    # um marcador de diretório ('a/b/') conta como contido nele mesmo
+    return [key[:i+1] for i, c in enumerate(key) if c == '/' and i + 1 >= len(base)]
+
+
+def prefix_end(prefix:str) -> str:
+    # limite superior para consultas de intervalo: key >= prefix AND key < prefix_end(prefix)
+    return prefix + '\U0010ffff'
+
+
+class SQLiteStore(object):
+    # base dos índices locais: um arquivo sqlite em WAL, compartilhado pelos workers do host,
+    # uma conexão por thread
+
+    schema = ''
+
+    def __init__(self, path:str):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._local = threading.local()
+        self._connect().executescript(self.schema)
+
+    def _connect(self) -> sqlite3.Connection:
+        con = getattr(self._local, 'con', None)
+        if con is None:
+            con = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            con.execute('PRAGMA journal_mode=WAL')
+            con.execute('PRAGMA synchronous=NORMAL')
+            self._local.con = con
+        return con
+
+    def connection(self):
+        return _Transaction(self._connect())
+
+    def snapshot(self):
+        # só leitura: várias consultas vendo o mesmo estado, sem pegar o lock de escrita
+        return _Transaction(self._connect(), 'BEGIN')
+
+
+class _Transaction(object):
+    # with store.connection() as con: ... -> BEGIN IMMEDIATE / COMMIT / ROLLBACK
+    def __init__(self, con:sqlite3.Connection, begin:str='BEGIN IMMEDIATE'):
+        self.con = con
+        self.begin = begin
+
+    def __enter__(self) -> sqlite3.Connection:
+        self.con.execute(self.begin)
+        return self.con
+
+    def __exit__(self, exc_type, exc, tb):
+        self.con.execute('COMMIT' if exc_type is None else 'ROLLBACK')
+
+
+class CoveredIndex(SQLiteStore):
+    # índice de prefixos já varridos (cobertura). As chaves são absolutas no bucket, então roots
+    # diferentes (ex. .../Área_do_Cliente) compartilham o mesmo índice. Mutações só alteram
+    # prefixos cobertos; o que não dá para calcular derruba a cobertura, e a próxima consulta
+    # varre de novo. Coberturas vencem após max_age segundos.
+
+    prefixes_table = ''
+
+    def __init__(self, path:str, max_age:float=None):
+        self.max_age = max_age
+        super().__init__(path)
+
+    def _candidates(self, key:str) -> list:
+        # prefixos que podem cobrir a chave
+        return key_dirs(key)
+
+    def _coverage(self, con, key:str) -> str:
+        # prefixo coberto mais raso que contém a chave (None se não coberto ou vencido)
+        candidates = self._candidates(key)
+        if not candidates:
+            return None
+        rows = con.execute(f"SELECT prefix, built_at FROM {self.prefixes_table} WHERE prefix IN ({','.join('?' * len(candidates))}) ORDER BY length(prefix)", candidates).fetchall()
+        for prefix, built_at in rows:
+            if not self.max_age or built_at + self.max_age > time.time():
+                return prefix
+        return None
+
+    def covered(self, prefix:str) -> bool:
+        with self.connection() as con:
+            return self._coverage(con, prefix) is not None
+
+    def _set_coverage(self, con, prefix:str) -> None:
+        self._clear_coverage(con, prefix)
+        con.execute(f"INSERT INTO {self.prefixes_table} (prefix, built_at) VALUES (?, ?)", (prefix, time.time()))
+
+    def _clear_coverage(self, con, prefix:str) -> None:
+        con.execute(f"DELETE FROM {self.prefixes_table} WHERE prefix >= ? AND prefix < ?", (prefix, prefix_end(prefix)))
+
+    def invalidate(self, key:str) -> None:
+        # a mudança não pôde ser aplicada: a próxima leitura refaz a varredura
+        with self.connection() as con:
+            base = self._coverage(con, key)
+            if base is not None:
+                self._drop(con, base)
+            if key.endswith('/'):
+                self._clear_coverage(con, key)
+
+    def _drop(self, con, base:str) -> None:
+        con.execute(f"DELETE FROM {self.prefixes_table} WHERE prefix = ?", (base,))
+
+
+class SizeIndex(CoveredIndex):
+    # tamanho acumulado por diretório (bytes, arquivos, subdiretórios) de cada prefixo já varrido
+
+    prefixes_table = 'size_prefixes'
+    schema = '''
+        CREATE TABLE IF NOT EXISTS size_prefixes (prefix TEXT PRIMARY KEY, built_at REAL);
+        CREATE TABLE IF NOT EXISTS size_files (key TEXT PRIMARY KEY, size INTEGER);
+        CREATE TABLE IF NOT EXISTS size_dirs (dir TEXT PRIMARY KEY, bytes INTEGER, files INTEGER, dirs INTEGER, entries INTEGER);
+    '''
+
+    def build(self, prefix:str, objects) -> None:
+        # objects: iterável de dicts do list_objects_v2 (Key, Size) sob o prefixo, uma única varredura
+        files = dict()
+        dirs = dict()
+        for obj in objects:
+            key, size = obj['Key'], obj['Size']
+            files[key] = size
+            for d in key_dirs(key, prefix):
+                row = dirs.setdefault(d, [0, 0, 0, 0])
+                row[3] += 1
+                if not key.endswith('/'):
+                    row[0] += size
+                    row[1] += 1
+        for d in dirs:
+            for parent in key_dirs(d[:-1], prefix):
+                dirs[parent][2] += 1
+
+        with self.connection() as con:
+            con.execute("DELETE FROM size_files WHERE key >= ? AND key < ?", (prefix, prefix_end(prefix)))
+            con.execute("DELETE FROM size_dirs WHERE dir >= ? AND dir < ?", (prefix, prefix_end(prefix)))
+            con.executemany("INSERT INTO size_files (key, size) VALUES (?, ?)", files.items())
+            con.executemany("INSERT INTO size_dirs (dir, bytes, files, dirs, entries) VALUES (?, ?, ?, ?, ?)", ((d, *row) for d, row in dirs.items()))
+            self._set_coverage(con, prefix)
+
+    def tree(self, prefix:str) -> list:
+        # [(dir, bytes, files, dirs)] do prefixo e de todos os subdiretórios
+        with self.connection() as con:
+            return con.execute("SELECT dir, bytes, files, dirs FROM size_dirs WHERE dir >= ? AND dir < ? ORDER BY dir", (prefix, prefix_end(prefix))).fetchall()
+
+    def _apply(self, con, base:str, key:str, bytes_delta:int, files_delta:int, entries_delta:int) -> None:
+        # soma os deltas em todos os diretórios da chave (a partir de base), criando/removendo
+        # diretórios e ajustando a contagem de subdiretórios dos ancestrais
+        chain = key_dirs(key, base)
+        for d in chain:
+            if con.execute("SELECT 1 FROM size_dirs WHERE dir = ?", (d,)).fetchone() is None:
+                con.execute("INSERT INTO size_dirs (dir, bytes, files, dirs, entries) VALUES (?, 0, 0, 0, 0)", (d,))
+                self._count_dir(con, base, d, 1)
+            con.execute("UPDATE size_dirs SET bytes = bytes + ?, files = files + ?, entries = entries + ? WHERE dir = ?", (bytes_delta, files_delta, entries_delta, d))
+        for d in reversed(chain):
+            if con.execute("SELECT entries FROM size_dirs WHERE dir = ?", (d,)).fetchone()[0] <= 0 and d != base:
+                con.execute("DELETE FROM size_dirs WHERE dir = ?", (d,))
+                self._count_dir(con, base, d, -1)
+
+    def _count_dir(self, con, base:str, d:str, delta:int) -> None:
+        parents = key_dirs(d[:-1], base)
+        if parents:
+            con.execute(f"UPDATE size_dirs SET dirs = dirs + ? WHERE dir IN ({','.join('?' * len(parents))})", (delta, *parents))
+
+    def add_objects(self, objects:list) -> None:
+        # objects: [(key, size)]; size None = desconhecido -> derruba a cobertura
+        with self.connection() as con:
+            for key, size in objects:
+                base = self._coverage(con, key)
+                if base is None:
+                    continue
+                if size is None:
+                    self._drop(con, base)
+                    continue
+                old = con.execute("SELECT size FROM size_files WHERE key = ?", (key,)).fetchone()
+                is_file = not key.endswith('/')
+                if old is None:
+                    con.execute("INSERT INTO size_files (key, size) VALUES (?, ?)", (key, size))
+                    self._apply(con, base, key, size if is_file else 0, 1 if is_file else 0, 1)
+                else:
+                    con.execute("UPDATE size_files SET size = ? WHERE key = ?", (size, key))
+                    self._apply(con, base, key, (size - old[0]) if is_file else 0, 0, 0)
+
+    def add_object(self, key:str, size:int) -> None:
+        self.add_objects([(key, size)])
+
+    def remove_object(self, key:str) -> None:
+        with self.connection() as con:
+            base = self._coverage(con, key)
+            if base is None:
+                return
+            old = con.execute("SELECT size FROM size_files WHERE key = ?", (key,)).fetchone()
+            if old is None:
+                return
+            con.execute("DELETE FROM size_files WHERE key = ?", (key,))
+            is_file = not key.endswith('/')
+            self._apply(con, base, key, -old[0] if is_file else 0, -1 if is_file else 0, -1)
+
+    def object_size(self, key:str) -> int:
+        with self.connection() as con:
+            row = con.execute("SELECT size FROM size_files WHERE key = ?", (key,)).fetchone()
+            return row[0] if row else None
+
+    def files(self, prefix:str) -> list:
+        # [(key, size)] conhecidos sob o prefixo
+        with self.connection() as con:
+            return con.execute("SELECT key, size FROM size_files WHERE key >= ? AND key < ?", (prefix, prefix_end(prefix))).fetchall()
+
+    def remove_prefix(self, prefix:str) -> None:
+        with self.connection() as con:
+            base = self._coverage(con, prefix)
+            row = con.execute("SELECT bytes, files, dirs, entries FROM size_dirs WHERE dir = ?", (prefix,)).fetchone()
+            con.execute("DELETE FROM size_files WHERE key >= ? AND key < ?", (prefix, prefix_end(prefix)))
+            con.execute("DELETE FROM size_dirs WHERE dir >= ? AND dir < ?", (prefix, prefix_end(prefix)))
+            self._clear_coverage(con, prefix)
+            if base is None or base == prefix or row is None:
+                return
+            # tira o subtotal do diretório removido dos ancestrais (ele próprio já saiu da tabela)
+            parent = prefix[:prefix[:-1].rfind('/') + 1]
+            self._count_dir(con, base, prefix, -(row[2] + 1))
+            self._apply(con, base, parent, -row[0], -row[1], -row[3])
+
+
+def key_name(key:str) -> str:
+    # último componente da chave (nome do arquivo ou do diretório)
+    return key.rstrip('/').rsplit('/', 1)[-1]
+
+
+def trigrams(text:str) -> set:
+    return {text[i:i+3] for i in range(len(text) - 2)}
+
+
+class NameIndex(CoveredIndex):
+    # índice invertido de trigramas sobre o nome (último componente) de cada chave dos prefixos já
+    # varridos; busca por substring sem ir ao S3. normalize é aplicado aos nomes e às consultas
+    # (ex. sem acentos + casefold). Nomes com menos de 3 caracteres não geram trigramas e só
+    # casam com consultas curtas, que são resolvidas por varredura do prefixo.
+
+    prefixes_table = 'name_prefixes'
+    schema = '''
+        CREATE TABLE IF NOT EXISTS name_prefixes (prefix TEXT PRIMARY KEY, built_at REAL);
+        CREATE TABLE IF NOT EXISTS name_entries (key TEXT PRIMARY KEY, name TEXT, size INTEGER, modified REAL, user TEXT);
+        CREATE TABLE IF NOT EXISTS name_grams (gram TEXT, key TEXT, PRIMARY KEY (gram, key)) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS name_grams_key ON name_grams (key);
+    '''
+
+    def __init__(self, path:str, max_age:float=None, normalize=str.casefold):
+        self.normalize = normalize
+        super().__init__(path, max_age)
+
+    def _put(self, con, key:str, size:int, modified:float, user:str) -> None:
+        name = self.normalize(key_name(key))
+        con.execute("INSERT OR REPLACE INTO name_entries (key, name, size, modified, user) VALUES (?, ?, ?, ?, ?)", (key, name, size, modified, user or ''))
+        con.execute("DELETE FROM name_grams WHERE key = ?", (key,))
+        con.executemany("INSERT INTO name_grams (gram, key) VALUES (?, ?)", ((g, key) for g in trigrams(name)))
+
+    def _delete(self, con, key:str) -> None:
+        con.execute("DELETE FROM name_entries WHERE key = ?", (key,))
+        con.execute("DELETE FROM name_grams WHERE key = ?", (key,))
+
+    def _delete_prefix(self, con, prefix:str) -> None:
+        con.execute("DELETE FROM name_entries WHERE key >= ? AND key < ?", (prefix, prefix_end(prefix)))
+        con.execute("DELETE FROM name_grams WHERE key >= ? AND key < ?", (prefix, prefix_end(prefix)))
+
+    def build(self, prefix:str, entries) -> None:
+        # entries: iterável de (key, size, modified epoch, user) sob o prefixo, uma única varredura
+        with self.connection() as con:
+            self._delete_prefix(con, prefix)
+            for key, size, modified, user in entries:
+                self._put(con, key, size, modified, user)
+            self._set_coverage(con, prefix)
+
+    def search(self, prefix:str, text:str, offset:int=0, limit:int=None) -> list:
+        # [(key, size, modified, user)] sob o prefixo (exclusive) cujo nome contém text, por chave
+        query = self.normalize(text)
+        grams = sorted(trigrams(query))
+        page = (limit if limit is not None else -1, offset)
+        with self.connection() as con:
+            if not grams:
+                return con.execute("SELECT key, size, modified, user FROM name_entries WHERE key > ? AND key < ? AND instr(name, ?) > 0 ORDER BY key LIMIT ? OFFSET ?",
+                                   (prefix, prefix_end(prefix), query, *page)).fetchall()
+            return con.execute(f'''SELECT e.key, e.size, e.modified, e.user FROM name_entries e
+                                   JOIN (SELECT key FROM name_grams WHERE gram IN ({','.join('?' * len(grams))}) AND key > ? AND key < ?
+                                         GROUP BY key HAVING COUNT(*) = ?) g ON g.key = e.key
+                                   WHERE instr(e.name, ?) > 0 ORDER BY e.key LIMIT ? OFFSET ?''',
+                               (*grams, prefix, prefix_end(prefix), len(grams), query, *page)).fetchall()
+
+    def add_objects(self, objects:list) -> None:
+        # objects: [(key, size, user)] gravados agora; size None = desconhecido -> derruba a cobertura
+        with self.connection() as con:
+            for key, size, user in objects:
+                base = self._coverage(con, key)
+                if base is None:
+                    continue
+                if size is None:
+                    self._drop(con, base)
+                    continue
+                self._put(con, key, size, time.time(), user)
+
+    def add_object(self, key:str, size:int, user:str=None) -> None:
+        self.add_objects([(key, size, user)])
+
+    def remove_object(self, key:str) -> None:
+        with self.connection() as con:
+            self._delete(con, key)
+
+    def remove_prefix(self, prefix:str) -> None:
+        with self.connection() as con:
+            self._delete_prefix(con, prefix)
+            self._clear_coverage(con, prefix)
+
+    def move(self, old_prefix:str, new_prefix:str) -> None:
+        # chave ou prefixo ('/' no fim) copiado no servidor e apagado: mantém tamanho e usuário,
+        # a data passa a ser a da cópia
+        with self.connection() as con:
+            if old_prefix.endswith('/'):
+                rows = con.execute("SELECT key, size, user FROM name_entries WHERE key >= ? AND key < ?", (old_prefix, prefix_end(old_prefix))).fetchall()
+                known = self._coverage(con, old_prefix) is not None
+                self._delete_prefix(con, old_prefix)
+                self._clear_coverage(con, old_prefix)
+            else:
+                rows = con.execute("SELECT key, size, user FROM name_entries WHERE key = ?", (old_prefix,)).fetchall()
+                known = bool(rows)
+                self._delete(con, old_prefix)
+            base = self._coverage(con, new_prefix)
+            if base is None:
+                return
+            if not known:
+                self._drop(con, base)
+                return
+            now = time.time()
+            for key, size, user in rows:
+                self._put(con, new_prefix + key[len(old_prefix):], size, now, user)
+
+
+def key_parent(key:str) -> str:
+    # diretório onde a chave aparece na listagem ('a/b/c.txt' e 'a/b/c/' -> 'a/b/'; 'a/' -> '')
+    return key[:key[:-1].rfind('/') + 1]
+
+
+class Catalog(CoveredIndex):
+    # espelho local do bucket: (key, size, modified epoch, etag, user) de cada objeto, mais a
+    # contagem de chaves por diretório, para listar um diretório (filhos diretos) por consulta
+    # indexada. Todas as mutações são aplicadas (write-through) e registradas num log; varreduras
+    # (build/apply com since) não sobrescrevem chaves alteradas depois que começaram.
+    # Chaves/prefixos em catalog_stale têm estado desconhecido (ex. falha no meio de uma operação)
+    # e as listagens que dependem deles voltam ao S3 até serem atualizados.
+
+    prefixes_table = 'catalog_prefixes'
+    schema = '''
+        CREATE TABLE IF NOT EXISTS catalog_prefixes (prefix TEXT PRIMARY KEY, built_at REAL);
+        CREATE TABLE IF NOT EXISTS catalog_objects (key TEXT PRIMARY KEY, parent TEXT, size INTEGER, modified REAL, etag TEXT, user TEXT);
+        CREATE INDEX IF NOT EXISTS catalog_objects_parent ON catalog_objects (parent, key);
+        CREATE TABLE IF NOT EXISTS catalog_dirs (dir TEXT PRIMARY KEY, parent TEXT, entries INTEGER);
+        CREATE INDEX IF NOT EXISTS catalog_dirs_parent ON catalog_dirs (parent, dir);
+        CREATE TABLE IF NOT EXISTS catalog_stale (key TEXT PRIMARY KEY, at REAL);
+        CREATE TABLE IF NOT EXISTS catalog_log (seq INTEGER PRIMARY KEY AUTOINCREMENT, key TEXT, recursive INTEGER, at REAL);
+        CREATE TABLE IF NOT EXISTS catalog_state (name TEXT PRIMARY KEY, value TEXT);
+    '''
+    chunk_size = 2000
+
+    def _candidates(self, key:str) -> list:
+        # o bucket inteiro ('') também pode estar coberto
+        return [''] + key_dirs(key)
+
+    def _log(self, con, keys, recursive:bool=False) -> None:
+        now = time.time()
+        con.executemany("INSERT INTO catalog_log (key, recursive, at) VALUES (?, ?, ?)", ((key, int(recursive), now) for key in keys))
+
+    def _put(self, con, key:str, size:int, modified:float, etag:str, user:str) -> None:
+        new = con.execute("SELECT 1 FROM catalog_objects WHERE key = ?", (key,)).fetchone() is None
+        con.execute("INSERT OR REPLACE INTO catalog_objects (key, parent, size, modified, etag, user) VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, key_parent(key), size, modified, etag, user or ''))
+        if new:
+            con.executemany("INSERT INTO catalog_dirs (dir, parent, entries) VALUES (?, ?, 1) ON CONFLICT (dir) DO UPDATE SET entries = entries + 1",
+                            ((d, key_parent(d)) for d in key_dirs(key)))
+
+    def _delete(self, con, key:str) -> None:
+        if con.execute("DELETE FROM catalog_objects WHERE key = ?", (key,)).rowcount:
+            self._count(con, key_dirs(key), -1)
+
+    def _delete_prefix(self, con, prefix:str) -> None:
+        removed = con.execute("DELETE FROM catalog_objects WHERE key >= ? AND key < ?", (prefix, prefix_end(prefix))).rowcount
+        con.execute("DELETE FROM catalog_dirs WHERE dir >= ? AND dir < ?", (prefix, prefix_end(prefix)))
+        if removed and prefix:
+            self._count(con, key_dirs(prefix[:-1]), -removed)
+
+    def _count(self, con, dirs:list, delta:int) -> None:
+        if dirs:
+            marks = ','.join('?' * len(dirs))
+            con.execute(f"UPDATE catalog_dirs SET entries = entries + ? WHERE dir IN ({marks})", (delta, *dirs))
+            con.execute(f"DELETE FROM catalog_dirs WHERE entries <= 0 AND dir IN ({marks})", dirs)
+
+    def mark(self) -> int:
+        # posição atual do log; passada como since para build/apply
+        return self._connect().execute("SELECT coalesce(max(seq), 0) FROM catalog_log").fetchone()[0]
+
+    def _changed_since(self, con, since:int):
+        # predicado: chave alterada por uma mutação registrada depois de since
+        exact, trees = set(), list()
+        for key, recursive in con.execute("SELECT key, recursive FROM catalog_log WHERE seq > ?", (since,)):
+            (trees.append if recursive else exact.add)(key)
+        trees = tuple(trees)
+        return lambda key: key in exact or bool(trees and key.startswith(trees))
+
+    def build(self, prefix:str, entries) -> None:
+        # entries: iterável (pode ser lento, ex. varredura do S3) de (key, size, modified epoch,
+        # etag, user) sob o prefixo. Enquanto a carga não termina o prefixo fica como stale
+        started = time.time()
+        with self.connection() as con:
+            con.execute("INSERT OR REPLACE INTO catalog_stale (key, at) VALUES (?, ?)", (prefix, started))
+            self._delete_prefix(con, prefix)
+        since = self.mark()
+        batch = list()
+        for entry in entries:
+            batch.append(entry)
+            if len(batch) >= self.chunk_size:
+                self.apply(batch, [], since)
+                batch = list()
+        self.apply(batch, [], since)
+        with self.connection() as con:
+            con.execute("DELETE FROM catalog_stale WHERE key >= ? AND key < ? AND at <= ?", (prefix, prefix_end(prefix), started))
+            self._set_coverage(con, prefix)
+
+    def apply(self, puts:list, removes:list, since:int=None) -> None:
+        # resultado de uma varredura: puts [(key, size, modified, etag, user)], removes [key];
+        # com since, ignora as chaves que as mutações alteraram depois dele
+        with self.connection() as con:
+            changed = self._changed_since(con, since) if since is not None else (lambda key: False)
+            for key, size, modified, etag, user in puts:
+                if not changed(key):
+                    self._put(con, key, size, modified, etag, user)
+            for key in removes:
+                if not changed(key):
+                    self._delete(con, key)
+
+    def fresh(self, prefix:str) -> bool:
+        # a listagem do diretório pode vir do catálogo: coberto e sem pendências que a afetem
+        with self.snapshot() as con:
+            return self._fresh(con, prefix)
+
+    def _fresh(self, con, prefix:str) -> bool:
+        if self._coverage(con, prefix) is None:
+            return False
+        for (key,) in con.execute("SELECT key FROM catalog_stale"):
+            if key.endswith('/') or not key:
+                if key.startswith(prefix) or prefix.startswith(key):
+                    return False
+            elif key_parent(key) == prefix:
+                return False
+        return True
+
+    def children(self, prefix:str):
+        # (subdiretórios, arquivos [(key, size, modified, etag, user)], existe) do diretório,
+        # como uma listagem com Delimiter '/'; None se o catálogo não serve para ele
+        with self.snapshot() as con:
+            if not self._fresh(con, prefix):
+                return None
+            dirs = [d for (d,) in con.execute("SELECT dir FROM catalog_dirs WHERE parent = ? ORDER BY dir", (prefix,))]
+            files = con.execute("SELECT key, size, modified, etag, user FROM catalog_objects WHERE parent = ? AND substr(key, -1) != '/' ORDER BY key", (prefix,)).fetchall()
+            exists = bool(dirs or files) or con.execute("SELECT 1 FROM catalog_dirs WHERE dir = ?", (prefix,)).fetchone() is not None
+            return dirs, files, exists
+
+    def objects(self, prefix:str) -> list:
+        # [(key, size, modified, etag, user)] de toda a árvore; None se o catálogo não serve
+        with self.snapshot() as con:
+            if self._coverage(con, prefix) is None or any(key.startswith(prefix) or prefix.startswith(key) for (key,) in con.execute("SELECT key FROM catalog_stale")):
+                return None
+            return con.execute("SELECT key, size, modified, etag, user FROM catalog_objects WHERE key >= ? AND key < ? ORDER BY key", (prefix, prefix_end(prefix))).fetchall()
+
+    def diff(self, start_after:str, last_key:str, page:list) -> tuple:
+        # compara uma página de list_objects_v2 (StartAfter=start_after) com o catálogo no
+        # intervalo (start_after, last_key] (last_key None = até o fim do bucket).
+        # page: [(key, size, etag)]. Retorna (chaves que sumiram, [(key, size, etag)] novas ou alteradas)
+        end = last_key if last_key is not None else prefix_end('')
+        with self.snapshot() as con:
+            known = {key: (size, etag) for key, size, etag in con.execute("SELECT key, size, etag FROM catalog_objects WHERE key > ? AND key <= ?", (start_after, end))}
+        listed = {key for key, size, etag in page}
+        removed = [key for key in known if key not in listed]
+        changed = [(key, size, etag) for key, size, etag in page if known.get(key) != (size, etag)]
+        return removed, changed
+
+    def touch(self, prefix:str) -> None:
+        # uma reconciliação completa terminou: renova a validade da cobertura
+        with self.connection() as con:
+            con.execute("UPDATE catalog_prefixes SET built_at = ? WHERE prefix = ?", (time.time(), prefix))
+
+    def put_objects(self, objects:list) -> None:
+        # objects: [(key, size, modified, etag, user)] gravados agora pela aplicação
+        with self.connection() as con:
+            for key, size, modified, etag, user in objects:
+                self._put(con, key, size, modified, etag, user)
+            self._log(con, [obj[0] for obj in objects])
+
+    def remove_object(self, key:str) -> None:
+        with self.connection() as con:
+            self._delete(con, key)
+            self._log(con, [key])
+
+    def remove_prefix(self, prefix:str) -> None:
+        with self.connection() as con:
+            self._delete_prefix(con, prefix)
+            self._log(con, [prefix], recursive=True)
+
+    def move(self, old_prefix:str, new_prefix:str) -> None:
+        # chave ou prefixo ('/' no fim) copiado no servidor e apagado: mantém tamanho, ETag e dono
+        recursive = old_prefix.endswith('/')
+        with self.connection() as con:
+            if recursive:
+                rows = con.execute("SELECT key, size, etag, user FROM catalog_objects WHERE key >= ? AND key < ?", (old_prefix, prefix_end(old_prefix))).fetchall()
+                self._delete_prefix(con, old_prefix)
+            else:
+                rows = con.execute("SELECT key, size, etag, user FROM catalog_objects WHERE key = ?", (old_prefix,)).fetchall()
+                self._delete(con, old_prefix)
+            now = time.time()
+            for key, size, etag, user in rows:
+                self._put(con, new_prefix + key[len(old_prefix):], size, now, etag, user)
+            self._log(con, [old_prefix, new_prefix], recursive=recursive)
+            if not rows and self._coverage(con, old_prefix) is None:
+                # origem desconhecida: o destino precisa ser lido de novo
+                con.execute("INSERT OR REPLACE INTO catalog_stale (key, at) VALUES (?, ?)", (new_prefix, now))
+
+    def invalidate(self, key:str) -> None:
+        # estado da chave (ou do prefixo, '/' no fim) desconhecido até o próximo refresh
+        with self.connection() as con:
+            con.execute("INSERT OR REPLACE INTO catalog_stale (key, at) VALUES (?, ?)", (key, time.time()))
+            self._log(con, [key], recursive=key.endswith('/'))
+
+    def stale(self) -> list:
+        return [key for (key,) in self._connect().execute("SELECT key FROM catalog_stale ORDER BY key")]
+
+    def clear_stale(self, key:str, before:float) -> None:
+        with self.connection() as con:
+            con.execute("DELETE FROM catalog_stale WHERE key = ? AND at <= ?", (key, before))
+
+    def state(self, name:str, default:str=None) -> str:
+        row = self._connect().execute("SELECT value FROM catalog_state WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else default
+
+    def set_state(self, name:str, value:str) -> None:
+        with self.connection() as con:
+            con.execute("INSERT OR REPLACE INTO catalog_state (name, value) VALUES (?, ?)", (name, value))
+
+    def prune_log(self, max_age:float) -> None:
+        with self.connection() as con:
+            con.execute("DELETE FROM catalog_log WHERE at < ?", (time.time() - max_age,))
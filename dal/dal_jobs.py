@@ -0,0 +1,105 @@
+import json
+import time
+import uuid
+
+from dal import dal_index
+
+# estados de um job; os três últimos são finais
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = 'queued', 'running', 'done', 'failed', 'cancelled'
+FINISHED = (DONE, FAILED, CANCELLED)
+
+
+class JobStore(dal_index.SQLiteStore):
+    # registros dos jobs em segundo plano, compartilhados pelos workers do host: qualquer worker
+    # responde o progresso, e um job cujo worker parou de dar sinal (heartbeat) pode ser
+    # retomado por outro. params/result são JSON; cancel é só um pedido, atendido pelo job
+
+    schema = '''
+        CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, kind TEXT, owner TEXT, params TEXT, state TEXT, stage TEXT,
+                                         done INTEGER, total INTEGER, result TEXT, error TEXT, cancel INTEGER,
+                                         pid INTEGER, attempts INTEGER, created_at REAL, updated_at REAL, heartbeat REAL);
+        CREATE INDEX IF NOT EXISTS jobs_owner ON jobs (owner, created_at);
+        CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, heartbeat);
+    '''
+
+    def create(self, kind:str, owner:str, params:dict) -> str:
+        # o mesmo pedido com um job ainda ativo (ex. duplo clique) devolve o job existente
+        params = json.dumps(params, sort_keys=True)
+        now = time.time()
+        with self.connection() as con:
+            row = con.execute("SELECT id FROM jobs WHERE kind = ? AND owner = ? AND params = ? AND state IN (?, ?)",
+                              (kind, owner, params, QUEUED, RUNNING)).fetchone()
+            if row:
+                return row[0]
+            job_id = uuid.uuid4().hex
+            con.execute('''INSERT INTO jobs (id, kind, owner, params, state, stage, done, total, cancel, attempts, created_at, updated_at, heartbeat)
+                           VALUES (?, ?, ?, ?, ?, '', 0, 0, 0, 0, ?, ?, ?)''', (job_id, kind, owner, params, QUEUED, now, now, now))
+            return job_id
+
+    def get(self, job_id:str) -> dict:
+        con = self._connect()
+        cursor = con.execute("SELECT * FROM jobs WHERE id = ?", (job_id,))
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        job = dict(zip([c[0] for c in cursor.description], row))
+        job['params'] = json.loads(job['params'])
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        return job
+
+    def list(self, owner:str, limit:int=20) -> list:
+        ids = [r[0] for r in self._connect().execute("SELECT id FROM jobs WHERE owner = ? ORDER BY created_at DESC LIMIT ?", (owner, limit))]
+        return [self.get(job_id) for job_id in ids]
+
+    def claim(self, job_id:str, pid:int, stale_before:float) -> bool:
+        # passa o job para RUNNING neste processo: se está na fila, ou rodando sem heartbeat desde
+        # stale_before (o worker que o tinha morreu)
+        now = time.time()
+        with self.connection() as con:
+            return con.execute('''UPDATE jobs SET state = ?, pid = ?, attempts = attempts + 1, updated_at = ?, heartbeat = ?
+                                  WHERE id = ? AND (state = ? OR (state = ? AND heartbeat < ?))''',
+                               (RUNNING, pid, now, now, job_id, QUEUED, RUNNING, stale_before)).rowcount == 1
+
+    def stale(self, stale_before:float) -> list:
+        # jobs na fila ou rodando cujo dono não dá sinal desde stale_before
+        return [r[0] for r in self._connect().execute("SELECT id FROM jobs WHERE state IN (?, ?) AND heartbeat < ? ORDER BY created_at",
+                                                      (QUEUED, RUNNING, stale_before))]
+
+    def heartbeat(self, job_ids:list, pid:int) -> None:
+        if not job_ids:
+            return
+        with self.connection() as con:
+            con.execute(f"UPDATE jobs SET heartbeat = ? WHERE pid = ? AND state = ? AND id IN ({','.join('?' * len(job_ids))})",
+                        (time.time(), pid, RUNNING, *job_ids))
+
+    def progress(self, job_id:str, stage:str, done:int, total:int) -> bool:
+        # grava o progresso; retorna True se foi pedido o cancelamento
+        now = time.time()
+        with self.connection() as con:
+            con.execute("UPDATE jobs SET stage = ?, done = ?, total = ?, updated_at = ?, heartbeat = ? WHERE id = ?",
+                        (stage, done, total, now, now, job_id))
+            return bool(con.execute("SELECT cancel FROM jobs WHERE id = ?", (job_id,)).fetchone()[0])
+
+    def finish(self, job_id:str, state:str, result=None, error:str=None) -> None:
+        with self.connection() as con:
+            con.execute("UPDATE jobs SET state = ?, result = ?, error = ?, updated_at = ? WHERE id = ?",
+                        (state, json.dumps(result) if result is not None else None, error, time.time(), job_id))
+
+    def cancel(self, job_id:str) -> bool:
+        # na fila: cancelado na hora; rodando: o job para no próximo aviso de progresso
+        now = time.time()
+        with self.connection() as con:
+            con.execute("UPDATE jobs SET state = ?, cancel = 1, updated_at = ? WHERE id = ? AND state = ?", (CANCELLED, now, job_id, QUEUED))
+            return con.execute("UPDATE jobs SET cancel = 1, updated_at = ? WHERE id = ? AND state IN (?, ?)",
+                               (now, job_id, RUNNING, CANCELLED)).rowcount == 1
+
+    def resume(self, job_id:str) -> bool:
+        # job que falhou ou foi cancelado volta para a fila (as operações são idempotentes)
+        now = time.time()
+        with self.connection() as con:
+            return con.execute("UPDATE jobs SET state = ?, cancel = 0, error = NULL, updated_at = ?, heartbeat = ? WHERE id = ? AND state IN (?, ?)",
+                               (QUEUED, now, now, job_id, FAILED, CANCELLED)).rowcount == 1
+
+    def prune(self, max_age:float) -> None:
+        with self.connection() as con:
+            con.execute(f"DELETE FROM jobs WHERE state IN ({','.join('?' * len(FINISHED))}) AND updated_at < ?", (*FINISHED, time.time() - max_age))
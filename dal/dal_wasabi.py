@@ -1,6 +1,72 @@
 import boto3
+from botocore.config import Config
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait, as_completed
+import io
+import os
+import queue
+import threading
+import time
 import unicodedata
+from collections import deque
+
+from dal import dal_cache
+from dal import dal_entry
+
+# pool limitado para as consultas de tags (get_object_tagging)
+TAG_WORKERS = int(os.getenv("WASABI_TAG_WORKERS", "16"))
+TAG_CACHE_SIZE = int(os.getenv("WASABI_TAG_CACHE_SIZE", "50000"))
+TAG_CACHE_TTL = float(os.getenv("WASABI_TAG_CACHE_TTL", str(24 * 3600)))
+
+_tag_pool = ThreadPoolExecutor(max_workers=TAG_WORKERS, thread_name_prefix="wasabi-tags")
+# (key, bucket) -> (etag, TagSet); só vale enquanto o ETag do objeto não mudar
+_tag_cache = dal_cache.TieredCache(None, 'tags', TAG_CACHE_SIZE, ttl=TAG_CACHE_TTL)
+
+
+def share_tag_cache(shared:dal_cache.SharedCache) -> None:
+    # passa a usar o cache de tags do host (comum a todos os workers)
+    global _tag_cache
+    _tag_cache = dal_cache.TieredCache(shared, 'tags', TAG_CACHE_SIZE, ttl=TAG_CACHE_TTL)
+
+# multipart upload: acima de MULTIPART_THRESHOLD o corpo vai em partes paralelas;
+# memória por upload fica limitada a MULTIPART_PART_SIZE * MULTIPART_CONCURRENCY
+MULTIPART_THRESHOLD = int(os.getenv("WASABI_MULTIPART_THRESHOLD", str(64 * 1024 * 1024)))
+MULTIPART_PART_SIZE = int(os.getenv("WASABI_MULTIPART_PART_SIZE", str(16 * 1024 * 1024)))
+MULTIPART_CONCURRENCY = int(os.getenv("WASABI_MULTIPART_CONCURRENCY", "4"))
+MULTIPART_RETRIES = int(os.getenv("WASABI_MULTIPART_RETRIES", "3"))
+MULTIPART_WORKERS = int(os.getenv("WASABI_MULTIPART_WORKERS", "16"))
+
+_upload_pool = ThreadPoolExecutor(max_workers=MULTIPART_WORKERS, thread_name_prefix="wasabi-upload")
+
+# cópia no servidor: acima de COPY_THRESHOLD (e sempre acima de 5GB, limite do copy_object) o
+# objeto é copiado em faixas de COPY_PART_SIZE com upload_part_copy, COPY_CONCURRENCY por vez.
+# Nada passa pelo worker, então as partes podem ser grandes
+COPY_MAX_SINGLE = 5 * 1024 * 1024 * 1024
+COPY_THRESHOLD = min(int(os.getenv("WASABI_COPY_THRESHOLD", str(512 * 1024 * 1024))), COPY_MAX_SINGLE)
+COPY_PART_SIZE = int(os.getenv("WASABI_COPY_PART_SIZE", str(256 * 1024 * 1024)))
+COPY_CONCURRENCY = int(os.getenv("WASABI_COPY_CONCURRENCY", "8"))
+COPY_WORKERS = int(os.getenv("WASABI_COPY_WORKERS", "16"))
+# cabeçalhos do objeto que o multipart precisa repassar (o copy_object simples já os copia)
+COPY_HEADERS = ('ContentType', 'ContentDisposition', 'ContentEncoding', 'ContentLanguage', 'CacheControl', 'Expires', 'Metadata')
+
+# separado do _batch_pool: as cópias de copy_keys rodam nele e esperam pelas partes
+_copy_pool = ThreadPoolExecutor(max_workers=COPY_WORKERS, thread_name_prefix="wasabi-copy")
+
+# operações em lote (copy/delete de árvores inteiras)
+BATCH_WORKERS = int(os.getenv("WASABI_BATCH_WORKERS", "16"))
+DELETE_BATCH_SIZE = 1000  # máximo do delete_objects
+
+_batch_pool = ThreadPoolExecutor(max_workers=BATCH_WORKERS, thread_name_prefix="wasabi-batch")
+
+# listagem particionada: subprefixos do primeiro nível listados em paralelo
+LIST_WORKERS = int(os.getenv("WASABI_LIST_WORKERS", "16"))
+LIST_CONCURRENCY = int(os.getenv("WASABI_LIST_CONCURRENCY", "8"))
+
+_list_pool = ThreadPoolExecutor(max_workers=LIST_WORKERS, thread_name_prefix="wasabi-list")
+
+# conexões HTTP mantidas pelo cliente S3 (o padrão do botocore é 10): no mínimo o maior pool
+# acima, senão as threads excedentes abrem e descartam uma conexão TLS a cada chamada
+MAX_POOL_CONNECTIONS = int(os.getenv("WASABI_MAX_POOL_CONNECTIONS", str(max(TAG_WORKERS, MULTIPART_WORKERS, COPY_WORKERS, BATCH_WORKERS, LIST_WORKERS))))
 
 def remove_accents(input_str):
     # Normalize the string to decompose combined characters into base characters and diacritics
@@ -11,7 +77,7 @@ def remove_accents(input_str):
 
 #boto3.set_stream_logger('')
 
-def create_client(type:str,endpoint_url:str, access_key_id:str, secret_access_key:str) -> boto3.client:
+def create_client(type:str,endpoint_url:str, access_key_id:str, secret_access_key:str, max_pool_connections:int=MAX_POOL_CONNECTIONS) -> boto3.client:
     if type == 'iam':
         return boto3.client('iam',
                         endpoint_url = endpoint_url,
@@ -22,7 +88,8 @@ def create_client(type:str,endpoint_url:str, access_key_id:str, secret_access_ke
         return boto3.client('s3',
                         endpoint_url = endpoint_url,
                         aws_access_key_id = access_key_id,
-                        aws_secret_access_key = secret_access_key)
+                        aws_secret_access_key = secret_access_key,
+                        config = Config(max_pool_connections=max_pool_connections))
     else:
         return None
 
@@ -38,9 +105,29 @@ def attach_user_policy(iam_client:boto3.client, user_name:str, policy_arn) -> No
     return iam_client.attach_user_policy(UserName=user_name, PolicyArn=policy_arn)
 
 
-def get_object(s3_client:boto3.client, bucket_name:str, bucket_dir:str, file_name:str) -> dict:
+class ObjectChanged(Exception):
+    # o objeto não tem mais o ETag esperado (if_match)
+    pass
+
+
+def get_object(s3_client:boto3.client, bucket_name:str, bucket_dir:str, file_name:str, byte_range:str=None, if_match:str=None) -> dict:
+    # byte_range no formato HTTP, ex. 'bytes=0-1023'; if_match: ETag do HEAD usado nos cabeçalhos
+    kwargs = {'Bucket': bucket_name, 'Key': bucket_dir + file_name}
+    if byte_range:
+        kwargs['Range'] = byte_range
+    if if_match:
+        kwargs['IfMatch'] = if_match
     try:
-        return s3_client.get_object(Bucket=bucket_name, Key=bucket_dir + file_name)
+        return s3_client.get_object(**kwargs)
+    except Exception as e:
+        if if_match and getattr(e, 'response', {}).get('Error', {}).get('Code') in ('PreconditionFailed', '412'):
+            raise ObjectChanged(bucket_dir + file_name)
+        return None
+
+
+def head_object(s3_client:boto3.client, bucket_name:str, bucket_dir:str, file_name:str) -> dict:
+    try:
+        return s3_client.head_object(Bucket=bucket_name, Key=bucket_dir + file_name)
     except:
         return None
 
@@ -56,34 +143,12 @@ def delete_object(s3_client:boto3.client, bucket_name:str, key_name:str) -> dict
     return s3_client.delete_object(Bucket=bucket_name, Key=key_name)
 
 
-def find_object(s3_client:boto3.client, bucket_name:str, bucket_dir:str, file_name:str) -> list:
-    continuation_token = None
-    found_files = list()
-
-    while True:
-        # Lista os objetos no bucket, com paginação se necessário
-        list_params = {'Bucket': bucket_name}
-        if continuation_token:
-            list_params['ContinuationToken'] = continuation_token
-        
-        response = s3_client.list_objects_v2(**list_params)
-
-        # Verifica se há objetos no bucket
-        if 'Contents' not in response:
-            return list()
-
-        # Itera sobre os objetos no bucket
-        for obj in response['Contents']:
-            # Verifica se o nome do arquivo está presente na chave do objeto e num diretório abaixo do bucket_dir
-            if bucket_dir in obj['Key'] and file_name in obj['Key']:
-                found_files.append({ 'obj':obj['Key'], 'name':Path(obj['Key']).stem, 'type':Path(obj['Key']).suffix[1:], 'size':obj['Size'], 'isdir':False, 'modified':obj['LastModified']})
-        # Verifica se há mais objetos a serem listados (paginação)
-        if response.get('IsTruncated'):  # Se a resposta foi truncada, há mais objetos
-            continuation_token = response['NextContinuationToken']
-        else:
-            break  # Se não há mais objetos, sai do loop
-
-    return found_files
+def find_object(s3_client:boto3.client, bucket_name:str, bucket_dir:str, file_name:str):
+    # gerador: objetos sob bucket_dir (prefixo do tenant) cujo caminho relativo contém file_name;
+    # quem chama pode parar no primeiro que interessar
+    for obj in list_partitioned(s3_client, bucket_name=bucket_name, prefix=bucket_dir):
+        if file_name in obj['Key'][len(bucket_dir):]:
+            yield dal_entry.Entry(obj['Key'], Path(obj['Key']).stem, type=Path(obj['Key']).suffix[1:], size_b=obj['Size'], modified=obj['LastModified'])
 
 
 def delete_objects(s3_client:boto3.client, bucket_name:str, del_objects) -> dict:
@@ -92,15 +157,123 @@ def delete_objects(s3_client:boto3.client, bucket_name:str, del_objects) -> dict
     return dict()
 
 
-def copy_objects(s3_client:boto3.client, bucket_name_from:str, bucket_name_to:str, from_object:str, to_object:str) -> dict:
-    return s3_client.copy_object(
-                        Bucket=bucket_name_to,
-                        Key=to_object,
-                        CopySource={
-                            'Bucket': bucket_name_from,
-                            'Key': from_object
-                        }
-                    )
+def copy_objects(s3_client:boto3.client, bucket_name_from:str, bucket_name_to:str, from_object:str, to_object:str, size:int=None) -> dict:
+    # size: tamanho da origem, se já conhecido (ex. da listagem); evita o HEAD nos objetos pequenos
+    if size is not None and size < COPY_THRESHOLD:
+        return s3_client.copy_object(
+                            Bucket=bucket_name_to,
+                            Key=to_object,
+                            CopySource={
+                                'Bucket': bucket_name_from,
+                                'Key': from_object
+                            }
+                        )
+    head = s3_client.head_object(Bucket=bucket_name_from, Key=from_object)
+    if head['ContentLength'] < COPY_THRESHOLD:
+        return copy_objects(s3_client, bucket_name_from, bucket_name_to, from_object, to_object, size=head['ContentLength'])
+    return copy_multipart(s3_client, bucket_name_from, bucket_name_to, from_object, to_object, head)
+
+
+def upload_part_copy(s3_client:boto3.client, bucket_name:str, key_name:str, upload_id:str, part_number:int, copy_source:dict, first:int, last:int, etag:str, retries:int=MULTIPART_RETRIES) -> dict:
+    # copia a faixa [first, last] da origem; CopySourceIfMatch falha se a origem mudar no meio da cópia
+    attempt = 0
+    while True:
+        try:
+            resp = s3_client.upload_part_copy(Bucket=bucket_name, Key=key_name, PartNumber=part_number, UploadId=upload_id,
+                                              CopySource=copy_source, CopySourceRange=f"bytes={first}-{last}", CopySourceIfMatch=etag)
+            return {'PartNumber': part_number, 'ETag': resp['CopyPartResult']['ETag']}
+        except Exception:
+            attempt += 1
+            if attempt > retries:
+                raise
+            time.sleep(0.5 * 2 ** attempt)
+
+
+def copy_multipart(s3_client:boto3.client, bucket_name_from:str, bucket_name_to:str, from_object:str, to_object:str, head:dict,
+                   part_size:int=COPY_PART_SIZE, concurrency:int=COPY_CONCURRENCY, retries:int=MULTIPART_RETRIES) -> dict:
+    # head: resposta do head_object da origem; cabeçalhos e metadados vão no create, as tags depois do complete
+    size = head['ContentLength']
+    part_size = max(part_size, 5 * 1024 * 1024, -(-size // 10000))  # mínimo do S3 e máximo de 10000 partes
+    part_size = min(part_size, COPY_MAX_SINGLE)
+    copy_source = {'Bucket': bucket_name_from, 'Key': from_object}
+    tags = s3_client.get_object_tagging(Bucket=bucket_name_from, Key=from_object)['TagSet']
+    upload_id = create_multipart_upload(s3_client, bucket_name_to, to_object, **{h: head[h] for h in COPY_HEADERS if head.get(h)})
+    parts = []
+    in_flight = set()
+    try:
+        for part_number, first in enumerate(range(0, size, part_size), start=1):
+            in_flight.add(_copy_pool.submit(upload_part_copy, s3_client, bucket_name_to, to_object, upload_id, part_number,
+                                            copy_source, first, min(first + part_size, size) - 1, head['ETag'], retries))
+            if len(in_flight) >= concurrency:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                parts.extend(f.result() for f in done)
+        parts.extend(f.result() for f in wait(in_flight)[0])
+        in_flight = set()
+        resp = complete_multipart_upload(s3_client, bucket_name_to, to_object, upload_id, parts)
+    except BaseException:
+        for f in in_flight:
+            f.cancel()
+        wait(in_flight)
+        try:
+            abort_multipart_upload(s3_client, bucket_name_to, to_object, upload_id)
+        except Exception as e:
+            print(f"abort_multipart_upload {to_object}: {e}")
+        raise
+    if tags:
+        s3_client.put_object_tagging(Bucket=bucket_name_to, Key=to_object, Tagging={'TagSet': tags})
+    _tag_cache.invalidate([to_object])
+    return resp
+
+
+def copy_keys(s3_client:boto3.client, bucket_name:str, pairs:list, progress=None, sizes:dict=None) -> dict:
+    # pairs: lista de (origem, destino) copiados no servidor em paralelo; sizes: {origem: tamanho}, se conhecido
+    # retorna {origem: None | mensagem de erro}; progress(feitos, total) a cada cópia
+    sizes = sizes or dict()
+    def copy(pair):
+        copy_objects(s3_client, bucket_name_from=bucket_name, bucket_name_to=bucket_name, from_object=pair[0], to_object=pair[1], size=sizes.get(pair[0]))
+
+    results = dict()
+    futures = {_batch_pool.submit(copy, pair): pair[0] for pair in pairs}
+    try:
+        for future in as_completed(futures):
+            error = future.exception()
+            results[futures[future]] = str(error) if error else None
+            if progress:
+                progress(len(results), len(futures))
+    except BaseException:
+        # progress pode interromper (ex. job cancelado): o que ainda não começou não roda
+        for future in futures:
+            future.cancel()
+        raise
+    return results
+
+
+def delete_keys(s3_client:boto3.client, bucket_name:str, keys:list, progress=None) -> dict:
+    # delete_objects em lotes de DELETE_BATCH_SIZE, lotes enviados em paralelo
+    # retorna {key: None | mensagem de erro}; progress(feitos, total) a cada lote
+    def delete(batch):
+        resp = delete_objects(s3_client, bucket_name, [{'Key': k} for k in batch])
+        errors = {e['Key']: f"{e.get('Code')}: {e.get('Message')}" for e in resp.get('Errors', [])}
+        return {k: errors.get(k) for k in batch}
+
+    results = dict()
+    batches = [keys[i:i + DELETE_BATCH_SIZE] for i in range(0, len(keys), DELETE_BATCH_SIZE)]
+    futures = {_batch_pool.submit(delete, batch): batch for batch in batches}
+    try:
+        for future in as_completed(futures):
+            error = future.exception()
+            if error:
+                results.update({k: str(error) for k in futures[future]})
+            else:
+                results.update(future.result())
+            if progress:
+                progress(len(results), len(keys))
+    except BaseException:
+        for future in futures:
+            future.cancel()
+        raise
+    return results
+
 
 def donwload_file(s3_client:boto3.client, bucket_name, bucket_dir, file_dir, filename) -> None:
     try:
@@ -117,35 +290,125 @@ def upload_file(s3_client:boto3.client, bucket_name, bucket_dir, file_dir, filen
     #    s3_client.upload_fileobj(f, bucket_name, bucket_dir + filename)
 
 
-def upload_largefile(s3_client:boto3.client, bucket_name, bucket_dir, file_dir, filename) -> None:
-    upload_id = 'Teste'
-    part_size = 1024 * 1024 * 5  # 5 MB part size
-    file_path = file_dir + filename
-    parts = []
+def upload_largefile(s3_client:boto3.client, bucket_name, bucket_dir, file_dir, filename) -> dict:
+    return upload_multipart(s3_client, bucket_name=bucket_name, key_name=bucket_dir + filename, source=file_dir + filename)
+
+
+def fileobj_size(body:any) -> int:
+    # tamanho do corpo a enviar (bytes, caminho ou file-like com seek); None se desconhecido
+    if body is None:
+        return 0
+    if isinstance(body, (bytes, bytearray)):
+        return len(body)
+    if isinstance(body, (str, os.PathLike)):
+        return os.path.getsize(body)
+    try:
+        pos = body.tell()
+        body.seek(0, os.SEEK_END)
+        size = body.tell() - pos
+        body.seek(pos)
+        return size
+    except Exception:
+        return None
+
 
-    with open(file_path, 'rb') as f:
+def upload_part(s3_client:boto3.client, bucket_name:str, key_name:str, upload_id:str, part_number:int, data:bytes, retries:int=MULTIPART_RETRIES) -> dict:
+    # reenvia só a parte que falhou, com backoff exponencial
+    attempt = 0
+    while True:
+        try:
+            resp = s3_client.upload_part(Bucket=bucket_name, Key=key_name, PartNumber=part_number, UploadId=upload_id, Body=data)
+            return {'PartNumber': part_number, 'ETag': resp['ETag']}
+        except Exception:
+            attempt += 1
+            if attempt > retries:
+                raise
+            time.sleep(0.5 * 2 ** attempt)
+
+
+def upload_multipart(s3_client:boto3.client, bucket_name:str, key_name:str, source:any, part_size:int=MULTIPART_PART_SIZE, concurrency:int=MULTIPART_CONCURRENCY, retries:int=MULTIPART_RETRIES) -> dict:
+    # source: caminho do arquivo, bytes ou file-like (ex. UploadFile.file)
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    elif isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as f:
+            return upload_multipart(s3_client, bucket_name, key_name, f, part_size=part_size, concurrency=concurrency, retries=retries)
+
+    part_size = max(part_size, 5 * 1024 * 1024)  # mínimo do S3 (exceto a última parte)
+    upload_id = create_multipart_upload(s3_client, bucket_name, key_name)
+    parts = []
+    in_flight = set()
+    try:
         part_number = 1
         while True:
-            data = f.read(part_size)
+            data = source.read(part_size)
             if not data:
-                break  # End of file
-
-            response = s3_client.upload_part(
-                Bucket=bucket_name,
-                Key=bucket_dir + filename,
-                PartNumber=part_number,
-                UploadId=upload_id,
-                Body=data
-            )
-            parts.append({'PartNumber': part_number, 'ETag': response['ETag']})
+                break
+            in_flight.add(_upload_pool.submit(upload_part, s3_client, bucket_name, key_name, upload_id, part_number, data, retries))
             part_number += 1
-    s3_client.complete_multipart_upload(
-        Bucket=bucket_name,
-        Key=bucket_dir + filename,
-        UploadId=upload_id,
-        MultipartUpload={'Parts': parts}
-    )
-    s3_client.abort_multipart_upload(Bucket=bucket_name, Key=bucket_dir + filename, UploadId=upload_id)
+            # no máximo `concurrency` partes em memória por upload
+            if len(in_flight) >= concurrency:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                parts.extend(f.result() for f in done)
+        parts.extend(f.result() for f in wait(in_flight)[0])
+        in_flight = set()
+
+        if not parts:
+            # corpo vazio: multipart exige ao menos uma parte
+            parts.append(upload_part(s3_client, bucket_name, key_name, upload_id, 1, b'', retries))
+
+        return complete_multipart_upload(s3_client, bucket_name, key_name, upload_id, parts)
+    except BaseException:
+        for f in in_flight:
+            f.cancel()
+        wait(in_flight)
+        try:
+            abort_multipart_upload(s3_client, bucket_name, key_name, upload_id)
+        except Exception as e:
+            print(f"abort_multipart_upload {key_name}: {e}")
+        raise
+
+
+def create_multipart_upload(s3_client:boto3.client, bucket_name:str, key_name:str, **headers) -> str:
+    # headers: ContentType, Metadata etc. do objeto final
+    return s3_client.create_multipart_upload(Bucket=bucket_name, Key=key_name, **headers)['UploadId']
+
+
+def list_parts(s3_client:boto3.client, bucket_name:str, key_name:str, upload_id:str) -> list:
+    # partes já recebidas pelo S3 (paginado, 1000 por página)
+    parts = []
+    kwargs = {'Bucket': bucket_name, 'Key': key_name, 'UploadId': upload_id}
+    while True:
+        resp = s3_client.list_parts(**kwargs)
+        parts.extend({'PartNumber': p['PartNumber'], 'ETag': p['ETag'], 'Size': p['Size']} for p in resp.get('Parts', []))
+        if not resp.get('IsTruncated'):
+            break
+        kwargs['PartNumberMarker'] = resp['NextPartNumberMarker']
+    return parts
+
+
+def complete_multipart_upload(s3_client:boto3.client, bucket_name:str, key_name:str, upload_id:str, parts:list) -> dict:
+    parts = sorted(({'PartNumber': p['PartNumber'], 'ETag': p['ETag']} for p in parts), key=lambda p: p['PartNumber'])
+    return s3_client.complete_multipart_upload(Bucket=bucket_name, Key=key_name, UploadId=upload_id, MultipartUpload={'Parts': parts})
+
+
+def abort_multipart_upload(s3_client:boto3.client, bucket_name:str, key_name:str, upload_id:str) -> dict:
+    return s3_client.abort_multipart_upload(Bucket=bucket_name, Key=key_name, UploadId=upload_id)
+
+
+def presigned_get_url(s3_client:boto3.client, bucket_name:str, key_name:str, expires:int, content_disposition:str=None, content_type:str=None) -> str:
+    # URL temporária de leitura; os Response* viram os cabeçalhos da resposta do S3
+    params = {'Bucket': bucket_name, 'Key': key_name}
+    if content_disposition:
+        params['ResponseContentDisposition'] = content_disposition
+    if content_type:
+        params['ResponseContentType'] = content_type
+    return s3_client.generate_presigned_url('get_object', Params=params, ExpiresIn=expires)
+
+
+def presigned_upload_part_url(s3_client:boto3.client, bucket_name:str, key_name:str, upload_id:str, part_number:int, expires:int) -> str:
+    # URL temporária para o browser enviar (PUT) uma parte do multipart direto ao bucket
+    return s3_client.generate_presigned_url('upload_part', Params={'Bucket': bucket_name, 'Key': key_name, 'UploadId': upload_id, 'PartNumber': part_number}, ExpiresIn=expires)
 
 
 def list_objects(s3_client:boto3.client, bucket_name:str, root:str, folder_name:str='/') -> list:
@@ -164,8 +427,84 @@ def list_objects(s3_client:boto3.client, bucket_name:str, root:str, folder_name:
     return s3_client.list_objects_v2(Bucket=bucket_name, Prefix=prefix)
 
 
+def list_object_pages(s3_client:boto3.client, bucket_name:str, prefix:str, delimiter:str=None):
+    # gerador das respostas do list_objects_v2 (páginas de até 1000 chaves) do prefixo
+    kwargs = {'Bucket': bucket_name, 'Prefix': prefix}
+    if delimiter:
+        kwargs['Delimiter'] = delimiter
+    while True:
+        resp = s3_client.list_objects_v2(**kwargs)
+        yield resp
+        if not resp.get('IsTruncated'):
+            break
+        kwargs['ContinuationToken'] = resp['NextContinuationToken']
+
+
+def list_page_after(s3_client:boto3.client, bucket_name:str, start_after:str='', max_keys:int=1000) -> dict:
+    # uma página do bucket inteiro em ordem de chave, a partir de (exclusive) start_after
+    kwargs = {'Bucket': bucket_name, 'MaxKeys': max_keys}
+    if start_after:
+        kwargs['StartAfter'] = start_after
+    return s3_client.list_objects_v2(**kwargs)
+
+
+def list_all_objects(s3_client:boto3.client, bucket_name:str, prefix:str, delimiter:str=None):
+    # gerador paginado sobre todas as chaves do prefixo (sem o limite de 1000 do list_objects)
+    for resp in list_object_pages(s3_client, bucket_name, prefix, delimiter):
+        yield from resp.get('Contents', [])
+
+
+def list_partitioned(s3_client:boto3.client, bucket_name:str, prefix:str, concurrency:int=LIST_CONCURRENCY):
+    # mesmas chaves de list_all_objects, mas o prefixo é dividido pelos CommonPrefixes do primeiro
+    # nível e até `concurrency` partições são listadas em paralelo (ordem entre partições não é
+    # garantida). As páginas passam por uma fila limitada: se quem consome parar (break/close),
+    # as listagens param na página seguinte e nada além disso fica em memória
+    pages = queue.Queue(maxsize=concurrency * 2)
+    stop = threading.Event()
+
+    def offer(item) -> bool:
+        while not stop.is_set():
+            try:
+                pages.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def crawl(partition:str):
+        try:
+            for resp in list_object_pages(s3_client, bucket_name, partition):
+                if not offer(('page', resp.get('Contents', []))):
+                    return
+        except Exception as e:
+            offer(('done', e))
+        else:
+            offer(('done', None))
+
+    partitions = deque()
+    try:
+        # primeiro nível: arquivos soltos saem direto, subprefixos viram partições
+        for resp in list_object_pages(s3_client, bucket_name, prefix, delimiter='/'):
+            yield from resp.get('Contents', [])
+            partitions.extend(p['Prefix'] for p in resp.get('CommonPrefixes', []))
+
+        running = 0
+        while partitions or running:
+            while partitions and running < concurrency:
+                _list_pool.submit(crawl, partitions.popleft())
+                running += 1
+            kind, value = pages.get()
+            if kind == 'page':
+                yield from value
+                continue
+            running -= 1
+            if value is not None:
+                raise value
+    finally:
+        stop.set()
+
+
 def list_folder_contents(s3_client:boto3.client, bucket_name:str, root:str, folder_name:str='/') -> list:
-    objects = []
     kwargs = {'Bucket': bucket_name}
     if folder_name != '/':
         kwargs['Prefix'] = root + '/' + folder_name
@@ -174,29 +513,43 @@ def list_folder_contents(s3_client:boto3.client, bucket_name:str, root:str, fold
     folder_name = kwargs['Prefix']
 
     kwargs['Delimiter'] = '/'
+    files = []
+    dirs = []
     existe_folder = False
     while True:
         resp = s3_client.list_objects_v2(**kwargs)
         # files
         for obj in resp.get('Contents',[]):
             existe_folder = True
-            if obj['Key'] != folder_name:
-                objects.append({ 'obj':obj['Key'], 'name':Path(obj['Key']).stem, 'type':Path(obj['Key']).suffix[1:], 'size':obj['Size'], 'isdir':False, 'modified':obj['LastModified']})
+            files.append((obj['Key'], obj['Size'], obj['LastModified'], obj.get('ETag'), ''))
         # subdir
         for obj in resp.get('CommonPrefixes',[]):
             existe_folder = True
-            if obj['Prefix'] != folder_name:
-                objects.append({ 'obj':obj['Prefix'], 'name':obj['Prefix'][len(folder_name) if folder_name else 0:-1], 'isdir':True })
+            dirs.append(obj['Prefix'])
               
         try:
             kwargs['ContinuationToken'] = resp['NextContinuationToken']
         except KeyError:
             break
 
+    return folder_entries(root, folder_name, files, dirs, existe_folder)
+
+
+def folder_entries(root:str, folder_name:str, files:list, dirs:list, existe_folder:bool) -> list:
+    # entradas da listagem de folder_name (prefixo completo) a partir dos filhos diretos:
+    # files [(key, size, LastModified, etag, user)], dirs [prefixo]; '.' e '..' se o diretório existe
+    objects = []
+    for key, size, modified, etag, user in files:
+        if key != folder_name:
+            objects.append(dal_entry.Entry(key, Path(key).stem, type=Path(key).suffix[1:], size_b=size, modified=modified, etag=etag, user=user))
+    for prefix in dirs:
+        if prefix != folder_name:
+            objects.append(dal_entry.Entry(prefix, prefix[len(folder_name) if folder_name else 0:-1], isdir=True))
+
     if existe_folder:
-        objects.append({ 'obj':folder_name, 'name':'.', 'isdir':True })
+        objects.append(dal_entry.Entry(folder_name, '.', isdir=True))
         if root != folder_name and folder_name:
-            objects.append({ 'obj':folder_name[:folder_name[:-1].rfind('/')+1], 'name':'..', 'isdir':True })
+            objects.append(dal_entry.Entry(folder_name[:folder_name[:-1].rfind('/')+1], '..', isdir=True))
 
     return objects
 
@@ -213,6 +566,47 @@ def get_tag(s3_client:boto3.client, bucket_name:str, file_path:str, tag_key_to_q
     return ""
 
 
+def get_tags_bulk(s3_client:boto3.client, bucket_name:str, objects:list) -> dict:
+    # objects: lista de (key, etag). Retorna {key: TagSet}
+    # consulta apenas o que não está no cache, em paralelo no pool de tags
+    result = dict()
+    pending = dict()
+    cache = _tag_cache.get_many([(key, bucket_name) for key, etag in objects])
+    for key, etag in objects:
+        cached = cache.get((key, bucket_name))
+        if cached and etag and cached[0] == etag:
+            result[key] = cached[1]
+        else:
+            pending[key] = etag
+
+    token = _tag_cache.token()
+    def fetch(key):
+        try:
+            return get_tags(s3_client, bucket_name, key)
+        except Exception:
+            # objeto removido entre a listagem e a consulta
+            return None
+
+    fetched = list()
+    for (key, etag), tags in zip(pending.items(), _tag_pool.map(fetch, pending.keys())):
+        if tags is None:
+            result[key] = []
+            continue
+        if etag:
+            fetched.append((key, bucket_name, (etag, tags)))
+        result[key] = tags
+    _tag_cache.set_many(fetched, token=token)
+    return result
+
+
+def get_tag_bulk(s3_client:boto3.client, bucket_name:str, objects:list, tag_key_to_query:str=None) -> dict:
+    # objects: lista de (key, etag). Retorna {key: valor da tag}
+    values = dict()
+    for key, tags in get_tags_bulk(s3_client, bucket_name, objects).items():
+        values[key] = next((tag['Value'] for tag in tags if tag['Key'] == tag_key_to_query), "")
+    return values
+
+
 def put_tag(s3_client:boto3.client, bucket_name:str, file_path:str, key:str, value:str) -> dict:
     tags = {
         'TagSet': [
@@ -222,7 +616,9 @@ def put_tag(s3_client:boto3.client, bucket_name:str, file_path:str, key:str, val
             },
         ]
     }
-    return s3_client.put_object_tagging(Bucket=bucket_name, Key=file_path, Tagging=tags)
+    resp = s3_client.put_object_tagging(Bucket=bucket_name, Key=file_path, Tagging=tags)
+    _tag_cache.invalidate([file_path])
+    return resp
 
 def update_tag(s3_client:boto3.client, bucket_name:str, file_path:str,  tag_key_to_update:str, new_tag_value:str) -> None:
     tags = get_tags(s3_client=s3_client, bucket_name=bucket_name, file_path=file_path)
@@ -240,4 +636,5 @@ def update_tag(s3_client:boto3.client, bucket_name:str, file_path:str,  tag_key_
         Bucket=bucket_name,
         Key=file_path,
         Tagging={'TagSet': tags}
-    )
\ No newline at end of file
+    )
+    _tag_cache.invalidate([file_path])
\ No newline at end of file